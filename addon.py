@@ -1,10 +1,71 @@
 import sys, os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'resources', 'site-packages'))
-from xbmctorrent import monkey_patches, plugin
+
+
+SERVICE_TIMEOUT = 60 # Longest wait for the next message of the service
+
+
+def run_in_service():
+    """Forwards the request to the resident service (see xbmctorrent.service),
+    if it runs. Returns False if the request must be handled here instead."""
+    import json
+    import socket
+    import xbmc
+    from contextlib import closing
+    import xbmcaddon
+
+    if len(sys.argv) < 3 or int(sys.argv[1]) < 0:
+        return False
+    port_file = xbmc.translatePath("special://profile/addon_data/%s/service.port" % xbmcaddon.Addon().getAddonInfo("id"))
+    try:
+        with open(port_file) as fp:
+            port, token = fp.read().split()
+        conn = socket.create_connection(("127.0.0.1", int(port)), 1)
+    except (IOError, ValueError, socket.error):
+        return False
+
+    from xbmcswift2 import Plugin
+    client = Plugin()
+    client._request = client._parse_request()
+    added = False
+    with closing(conn):
+        conn.settimeout(SERVICE_TIMEOUT)
+        conn.sendall("%s\n" % json.dumps({"url": sys.argv[0] + sys.argv[2], "handle": int(sys.argv[1]), "token": token}))
+        try:
+            for line in conn.makefile("rb"):
+                message = json.loads(line)
+                if "item" in message:
+                    item = message["item"]
+                    if item.get("context_menu"):
+                        item["context_menu"] = map(tuple, item["context_menu"])
+                    client.add_items([item])
+                    added = True
+                elif "content" in message:
+                    client.set_content(message["content"])
+                elif "sort_method" in message:
+                    client.add_sort_method(*message["sort_method"])
+                elif "finish" in message:
+                    client.finish(**message["finish"])
+                    return True
+                elif "error" in message:
+                    map(xbmc.log, message["error"].split("\n"))
+                    break
+                elif "fallback" in message:
+                    return False
+        except socket.error: # Timeouts too, handled here if nothing was added yet
+            pass
+    if added:
+        client.end_of_directory(succeeded=False)
+    return added
+
 
 if __name__ == '__main__':
     try:
-        plugin.run()
+        if not run_in_service():
+            from xbmctorrent import monkey_patches, plugin
+            from xbmctorrent.caching import join_prefetches
+            plugin.run()
+            join_prefetches() # The listing is out, let the next page make it to the cache
     except Exception, e:
         import xbmc
         import traceback
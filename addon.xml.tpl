@@ -6,6 +6,7 @@
     <extension point="xbmc.python.pluginsource" library="addon.py">
         <provides>video</provides>
     </extension>
+    <extension point="xbmc.service" library="service.py" start="login"/>
     <extension point="xbmc.addon.repository" name="XBMCtorrent Autoupdate Repository">
         <info compressed="false">http://xbmctorrent.herokuapp.com/addons.xml</info>
         <checksum>http://xbmctorrent.herokuapp.com/addons.xml.md5</checksum>
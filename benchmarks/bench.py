@@ -0,0 +1,389 @@
+"""Micro-benchmarks of the scrapers, plugin startup and torrent2http client,
+on synthetic inputs made up here, so that runs can be compared. Runs outside
+of XBMC, on Python 2, like the tests:
+
+    python benchmarks/bench.py [case...]
+
+Timings are the best of a few runs, per call."""
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+import support
+from xbmctorrent import monkey_patches, plugin
+
+CASES = []
+MIN_TIME = 0.2 # Seconds per run, to smooth out the clock
+REPEAT = 3
+
+
+def case(fn):
+    CASES.append(fn)
+    return fn
+
+
+def measure(fn):
+    """Returns the best time of REPEAT runs of fn, per call, in seconds."""
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < MIN_TIME:
+        number *= 2
+    return min(timer.repeat(REPEAT, number)) / number
+
+
+def report(label, seconds, extra=""):
+    print "  %-44s %11.4f ms  %s" % (label, seconds * 1000, extra)
+
+
+def make_page(rows, row_template, before="", after=""):
+    """Makes a result page of rows, with the usual header, sidebar and
+    scripts around, which parsers have to go through too."""
+    noise = "".join('<li><a href="/browse/%d" title="Category %d">Category %d</a></li>\n' % (i, i, i) for i in range(150))
+    script = '<script type="text/javascript">var ads = [%s];</script>\n' % ", ".join('"ad%d"' % i for i in range(200))
+    return ("<!DOCTYPE html>\n<html><head><title>Results</title>%s</head><body>"
+            '<div id="header"><ul>%s</ul></div>%s%s%s<div id="footer">%s</div></body></html>') % (
+        script, noise, before, "".join(row_template % {"i": i, "hash": "%040x" % i} for i in range(rows)), after, script)
+
+
+TPB_ROW = """<tr>
+<td class="vertTh"><center><a href="/browse/200">Video</a><br />(<a href="/browse/205">TV shows</a>)</center></td>
+<td>
+<div class="detName">\t<a href="/torrent/%(i)d/Show" class="detLink" title="Details for Show">Show.S01E%(i)02d.720p.HDTV.x264-GRP</a>
+</div>
+<a href="magnet:?xt=urn:btih:%(hash)s&amp;dn=Show&amp;tr=udp%%3A%%2F%%2Ftracker.example.com%%3A80" title="Download this torrent using magnet"><img src="/static/img/icon-magnet.gif" alt="Magnet link" /></a>
+<img src="/static/img/icon_comment.gif" alt="comment" />
+<font class="detDesc">Uploaded 03-14&nbsp;2014, Size 1.1&nbsp;GiB, ULed by <a class="detDesc" href="/user/x/">x</a></font>
+</td>
+<td align="right">1%(i)03d</td>
+<td align="right">%(i)d</td>
+</tr>
+"""
+
+BTDIGG_ROW = """<tr><td class="idx">%(i)d</td><td>
+<table class="torrent_name_tbl"><tr><td class="torrent_name"><a href="/search?info_hash=%(hash)s">Show <b>S01E%(i)02d</b> 720p</a></td></tr></table>
+<table class="torrent_name_tbl"><tr><td class="ttth"><a href="magnet:?xt=urn:btih:%(hash)s&amp;dn=Show">[magnet]</a></td>
+<td><span class="attr_name">Size:</span>&nbsp;<span class="attr_val">1.1&nbsp;GB</span>
+<span class="attr_name">Files:</span>&nbsp;<span class="attr_val">3</span>
+<span class="attr_name">Downloads:</span>&nbsp;<span class="attr_val">1%(i)02d</span></td></tr></table>
+</td></tr>
+"""
+
+
+def tpb_page():
+    return make_page(30, TPB_ROW, '<table id="searchResult">', "</table>")
+
+
+def btdigg_page():
+    return make_page(10, BTDIGG_ROW, '<table class="torrent_list">', "</table>")
+
+
+PARSE_SCRIPT = """
+import re, sys
+sys.path.insert(0, %(tests)r)
+import support
+from xbmctorrent import monkey_patches
+from xbmctorrent.scrapers import %(module)s as module
+from bs4 import BeautifulSoup, SoupStrainer
+import html5lib
+def status(field):
+    return int(re.search(r"%%s:\\s*(\\d+)" %% field, open("/proc/self/status").read()).group(1))
+page = sys.stdin.read()
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5") # Resets the peak RSS to the current one
+before = status("VmRSS")
+rows = %(parse)s
+print status("VmHWM") - before
+"""
+
+
+def peak_memory(module, parse, page):
+    """Returns how far parse takes the peak RSS of a fresh interpreter above
+    its RSS before, in KB (Linux 4.0 and later)."""
+    import subprocess
+    script = PARSE_SCRIPT % {"tests": os.path.dirname(support.__file__), "module": module, "parse": parse}
+    proc = subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    return int(proc.communicate(page)[0])
+
+
+@case
+def scrapers():
+    """Result rows of TPB and BTDigg pages, extracted with patterns, and
+    with the BeautifulSoup fallbacks: html.parser, building only the result
+    tables, then html5lib, which builds the whole DOM. Memory is the peak
+    RSS growth of a fresh interpreter parsing once."""
+    from bs4 import BeautifulSoup, SoupStrainer
+    from xbmctorrent.scrapers import tpb, btdigg
+    for name, module, page, strainer in (("TPB", tpb, tpb_page(), 'SoupStrainer("table", id="searchResult")'),
+                                         ("BTDigg", btdigg, btdigg_page(), 'SoupStrainer("table", "torrent_name_tbl")')):
+        module_name = module.__name__.rsplit(".", 1)[-1]
+        rows = list(module.parse_rows(page))
+        report("%s patterns" % name, measure(lambda: list(module.parse_rows(page))),
+               "%d rows out of a %d KB page, +%d KB peak" % (
+                   len(rows), len(page) / 1024, peak_memory(module_name, "list(module.parse_rows(page))", page)))
+        for label, soup in (("html.parser, strained", 'BeautifulSoup(page, "html.parser", parse_only=%s)' % strainer),
+                            ("html5lib", 'BeautifulSoup(page, "html5lib")')):
+            parse = "list(module.parse_rows_soup(%s))" % soup
+            env = {"module": module, "page": page, "BeautifulSoup": BeautifulSoup, "SoupStrainer": SoupStrainer}
+            assert rows == eval(parse, env), "%s %s disagrees with patterns" % (name, label)
+            report("%s %s" % (name, label), measure(lambda: eval(parse, env)),
+                   "%d DOM nodes, +%d KB peak" % (len(list(eval(soup, env).descendants)), peak_memory(module_name, parse, page)))
+
+
+@case
+def strainers():
+    """BeautifulSoup DOM of a TPB page: whole, with a SoupStrainer on the
+    results table, which the bundled html5lib tree builder ignores, and
+    with the html.parser builder, which honors it."""
+    import warnings
+    from bs4 import BeautifulSoup, SoupStrainer
+    warnings.simplefilter("ignore") # html5lib warns about parse_only, we know
+    page = tpb_page()
+    strainer = SoupStrainer("table", id="searchResult")
+    for label, features, parse_only in (("html5lib", "html5lib", None),
+                                        ("html5lib, strained", "html5lib", strainer),
+                                        ("html.parser", "html.parser", None),
+                                        ("html.parser, strained", "html.parser", strainer)):
+        soup = BeautifulSoup(page, features, parse_only=parse_only)
+        report(label, measure(lambda: BeautifulSoup(page, features, parse_only=parse_only)),
+               "%d DOM nodes" % len(list(soup.descendants)))
+
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, %(tests)r)
+import support
+start = time.time()
+modules = len(sys.modules)
+from xbmctorrent import monkey_patches, plugin
+from xbmctorrent.scrapers import MODULES, import_module_for
+if %(all)r:
+    for module in MODULES:
+        import_module_for(module["path"])
+else:
+    import_module_for(%(path)r)
+print time.time() - start, len(sys.modules) - modules
+"""
+
+
+@case
+def startup():
+    """Imports a click pays for before its view runs, in a fresh
+    interpreter like XBMC starts for each one (mock XBMC setup aside):
+    only the scraper owning the route, or all of them, as before."""
+    import subprocess
+    tests = os.path.dirname(support.__file__)
+    for label, path, all_scrapers in (("/", "/", False),
+                                      ("/play/<uri>", "/play/magnet:?xt=urn:btih:%040x" % 0, False),
+                                      ("/tpb/<root>/<page>", "/tpb/%2Fbrowse%2F205/0", False),
+                                      ("all scrapers", "/", True)):
+        runs = []
+        for i in range(REPEAT * 2):
+            script = IMPORT_SCRIPT % {"tests": tests, "path": path, "all": all_scrapers}
+            runs.append(map(float, subprocess.check_output([sys.executable, "-c", script]).split()))
+        seconds, modules = min(runs)
+        report(label, seconds, "%d modules imported" % modules)
+
+
+@case
+def dispatch():
+    """Matching a path to its route and making urls, per call, averaged
+    over all the routes: with the first segment index, and trying every
+    route in order, as before."""
+    from xbmcswift2.urls import NotFoundException
+    from xbmctorrent.scrapers import MODULES, import_module_for
+    for module in MODULES:
+        import_module_for(module["path"])
+
+    def _match(rules, path):
+        for rule in rules:
+            try:
+                return rule.match(path)
+            except NotFoundException:
+                pass
+
+    routes = [(rule, dict((keyword, "1") for keyword in rule._keywords)) for rule in plugin._routes]
+    paths = [rule.make_path_qs(items).split("?")[0] for rule, items in routes]
+    for path in paths:
+        assert _match(plugin._candidate_routes(path), path) == _match(plugin._routes, path)
+
+    def _all(fn):
+        return lambda: [fn(*args) for args in zip(paths, routes)]
+    extra = "%d routes" % len(routes)
+    report("indexed match", measure(_all(lambda path, route: _match(plugin._candidate_routes(path), path))) / len(routes), extra)
+    report("linear match", measure(_all(lambda path, route: _match(plugin._routes, path))) / len(routes), extra)
+    report("url_for", measure(_all(lambda path, (rule, items): plugin.url_for(rule._name, **items))) / len(routes), extra)
+
+
+CLICK_SCRIPT = """
+import sys, time
+sys.path.insert(0, %(tests)r)
+import support
+sys.argv = ["plugin://%%s%%s" %% (support.xbmcswift2.xbmcaddon.Addon().getAddonInfo("id"), %(path)r), "1", ""]
+start = time.time()
+execfile(%(addon)r, {"__name__": "__main__", "__file__": %(addon)r})
+sys.stderr.write("elapsed %%f %%d\\n" %% (time.time() - start, "xbmctorrent.plugin" in sys.modules))
+"""
+
+
+@case
+def service():
+    """A click on a static listing, in a fresh interpreter like XBMC starts
+    for each one (mock XBMC setup aside): handled in-process by addon.py,
+    and forwarded to the resident service."""
+    import threading
+    import subprocess
+    import xbmc
+    from xbmctorrent import service
+
+    tests = os.path.dirname(support.__file__)
+    script = CLICK_SCRIPT % {"tests": tests, "path": "/tpb", "addon": os.path.join(support.ROOT, "addon.py")}
+    env = dict(os.environ, XBMCTORRENT_ADDON_DIR=support.ADDON_DIR)
+    def _click(in_process):
+        proc = subprocess.Popen([sys.executable, "-c", script], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        seconds, imported = proc.communicate()[1].split("elapsed ")[-1].split()
+        assert int(imported) == in_process, "The click wasn't handled where expected"
+        return float(seconds)
+
+    report("in-process", min(_click(True) for i in range(REPEAT * 2)))
+    os.environ["XBMCSWIFT2_SERVICE"] = "true"
+    xbmc.abortRequested = False
+    server = threading.Thread(target=service.serve)
+    server.start()
+    try:
+        while not os.path.exists(service.PORT_FILE):
+            time.sleep(0.01)
+        _click(False) # Warms the service up
+        report("through the service", min(_click(False) for i in range(REPEAT * 2)))
+    finally:
+        xbmc.abortRequested = True
+        server.join()
+
+
+@case
+def analytics():
+    """What a tracked view waits for, with analytics off, and on: hits are
+    then spooled to disk, and sent by a background worker, left out here."""
+    from xbmcswift2 import Request
+    from xbmctorrent import ga
+
+    plugin._request = Request("plugin://%s/tpb" % plugin.id, 1)
+    view = ga.tracked(lambda: None)
+    flush, ga.flush = ga.flush, lambda: None
+    try:
+        for label, ga_disable in (("analytics off", "true"), ("analytics on", "false")):
+            plugin.set_setting("ga_disable", ga_disable)
+            seconds = measure(view)
+            with open(ga.SPOOL_FILE, "a+") as fp:
+                report(label, seconds, "%d hits spooled" % len(fp.readlines()))
+    finally:
+        ga.flush = flush
+        plugin.set_setting("ga_disable", "true")
+        if os.path.exists(ga.SPOOL_FILE):
+            os.remove(ga.SPOOL_FILE)
+
+
+def serve_torrent2http():
+    """Starts a keep-alive HTTP server answering /status and /ls like
+    torrent2http does, for a 200 files torrent. Returns it."""
+    import json
+    import threading
+    import BaseHTTPServer
+    import SocketServer
+
+    answers = {
+        "/status": json.dumps({"name": "Show Season 1", "state": 3, "progress": 0.1, "download_rate": 512,
+                               "upload_rate": 12, "num_peers": 40, "num_seeds": 20, "total_peers": 80, "total_seeds": 60}),
+        "/ls": json.dumps({"files": [{"name": "Show Season 1/Show.S01E%03d.mkv" % i, "size": 350 * 1024 * 1024,
+                                      "offset": i * 350 * 1024 * 1024, "download": 0, "progress": 0.0,
+                                      "url": "http://localhost/files/Show.S01E%03d.mkv" % i} for i in range(200)]}),
+    }
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Like torrent2http (Go sockets have TCP_NODELAY), so that keep-alive
+        # answers aren't held back waiting for delayed ACKs
+        wbufsize = -1
+        disable_nagle_algorithm = True
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(answers[self.path])))
+            self.end_headers()
+            self.wfile.write(answers[self.path])
+        def log_message(self, *args):
+            pass
+    class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True
+    server = Server(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+@case
+def polls():
+    """Polls of torrent2http, /status alone and with /ls, over the keep-alive
+    client, and with a new connection for each call, as before."""
+    from contextlib import closing
+    from xbmctorrent.torrent2http import Client
+    from xbmctorrent.utils import url_get_json
+
+    server = serve_torrent2http()
+    bind_address = "127.0.0.1:%d" % server.server_address[1]
+    try:
+        with closing(Client(bind_address)) as client:
+            for cmds in (["status"], ["status", "ls"]):
+                report("keep-alive client, /%s" % " /".join(cmds),
+                       measure(lambda: [client(cmd) for cmd in cmds]))
+                report("new connections, /%s" % " /".join(cmds),
+                       measure(lambda: [url_get_json("http://%s/%s" % (bind_address, cmd), with_immunicity=False) for cmd in cmds]))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_torrent_data(files, total_size, piece_length=256 * 1024):
+    from bencode import bencode
+    return bencode({
+        "announce": "udp://tracker.example.com:80/announce",
+        "announce-list": [["udp://tracker.example.com:80/announce"], ["http://tracker.example.org/announce"]],
+        "info": {
+            "name": "Show Complete",
+            "piece length": piece_length,
+            "pieces": os.urandom(20 * (total_size / piece_length)),
+            "files": [{"length": total_size / files, "path": ["Season %d" % (i / 100 + 1), "Show.E%04d.mkv" % i]} for i in range(files)],
+        },
+    })
+
+
+@case
+def torrents():
+    """Decoding a .torrent and hashing its info dict: with the metainfo
+    decoder, which hashes the info dict bytes in place, and with bencode,
+    which has to encode the info dict again, as before."""
+    import hashlib
+    from bencode import bencode, bdecode
+    from xbmctorrent import metainfo
+
+    def _bencode(data):
+        metadata = bdecode(data)
+        return metadata, hashlib.sha1(bencode(metadata["info"])).hexdigest()
+    for files, size in ((1, 1024 ** 3), (500, 40 * 1024 ** 3), (4000, 40 * 1024 ** 3)):
+        data = make_torrent_data(files, size)
+        assert metainfo.parse(data)[1] == _bencode(data)[1]
+        extra = "%d files, %d KB .torrent" % (files, len(data) / 1024)
+        report("metainfo", measure(lambda: metainfo.parse(data)), extra)
+        report("bencode", measure(lambda: _bencode(data)), extra)
+
+
+def main(names):
+    for fn in CASES:
+        if not names or fn.__name__ in names:
+            print "%s: %s" % (fn.__name__, " ".join(fn.__doc__.split()))
+            fn()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -69,6 +69,12 @@ class Plugin(XBMCMixin):
         self._routes = []
         self._view_functions = {}
 
+        # PATCH: rules indexed by their literal first path segment, so that
+        # _dispatch only tries the few rules which can match. Rules starting
+        # with a variable are in every bucket, keeping registration order.
+        self._routes_by_segment = {}
+        self._wildcard_routes = []
+
         # addon_id is no longer required as it can be parsed from addon.xml
         if addon_id:
             self._addon = xbmcaddon.Addon(id=addon_id)
@@ -76,6 +82,7 @@ class Plugin(XBMCMixin):
             self._addon = xbmcaddon.Addon()
 
         self._addon_id = addon_id or self._addon.getAddonInfo('id')
+        self._base_url = 'plugin://%s' % self._addon_id
         self._name = name or self._addon.getAddonInfo('name')
 
         self._info_type = info_type
@@ -267,6 +274,14 @@ class Plugin(XBMCMixin):
             self._view_functions[name] = rule
         self._routes.append(rule)
 
+        if rule.first_segment is None:
+            self._wildcard_routes.append(rule)
+            for rules in self._routes_by_segment.values():
+                rules.append(rule)
+        else:
+            self._routes_by_segment.setdefault(rule.first_segment,
+                list(self._wildcard_routes)).append(rule)
+
     def url_for(self, endpoint, **items):
         '''Returns a valid XBMC plugin URL for the given endpoint name.
         endpoint can be the literal name of a function, or it can
@@ -292,11 +307,17 @@ class Plugin(XBMCMixin):
             # TODO: Make this a regular exception
             raise AmbiguousUrlException
 
-        pathqs = rule.make_path_qs(items)
-        return 'plugin://%s%s' % (self._addon_id, pathqs)
+        return self._base_url + rule.make_path_qs(items)
+
+    def _candidate_routes(self, path):
+        '''Returns the rules which may match path, in registration order.'''
+        if not path.startswith('/'):
+            return self._routes
+        segment = path.split('/', 2)[1]
+        return self._routes_by_segment.get(segment, self._wildcard_routes)
 
     def _dispatch(self, path):
-        for rule in self._routes:
+        for rule in self._candidate_routes(path):
             try:
                 view_func, items = rule.match(path)
             except NotFoundException:
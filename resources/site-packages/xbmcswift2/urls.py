@@ -45,10 +45,24 @@ class UrlRule(object):
         self._view_func = view_func
         self._options = options or {}
         self._keywords = re.findall(r'\<(.+?)\>', url_rule)
+        self._keyword_set = frozenset(self._keywords)
 
         #change <> to {} for use with str.format()
         self._url_format = self._url_rule.replace('<', '{').replace('>', '}')
 
+        # PATCH: precompile the format used by url_for, as a plain % format
+        # is much cheaper than str.format() on every generated list item.
+        self._path_format = re.sub(r'\<(.+?)\>', r'%(\1)s',
+                                   self._url_rule.replace('%', '%%'))
+
+        # PATCH: literal first path segment, used by Plugin to only try the
+        # rules that can match a given path. None if it is a variable.
+        self._first_segment = None
+        if self._url_rule.startswith('/'):
+            segment = self._url_rule.split('/', 2)[1]
+            if '<' not in segment:
+                self._first_segment = segment
+
         # Make a regex pattern for matching incoming URLs
         rule = self._url_rule
         if rule != '/':
@@ -109,14 +123,9 @@ class UrlRule(object):
                                   ' of basestring' % (val, key))
             items[key] = quote_plus(val)
 
-        try:
-            path = self._url_format.format(**items)
-        except AttributeError:
-            # Old version of python
-            path = self._url_format
-            for key, val in items.items():
-                path = path.replace('{%s}' % key, val)
-        return path
+        if not self._keywords:
+            return self._url_rule
+        return self._path_format % items
 
     def _make_qs(self, items):
         '''Returns a query string for the given dictionary of items. All keys
@@ -143,26 +152,26 @@ class UrlRule(object):
                      hard limit on URL length. See the caching section if you
                      need to persist a large amount of data between requests.
         '''
-        # Convert any ints and longs to strings
-        for key, val in items.items():
-            if isinstance(val, (int, long)):
-                items[key] = str(val)
-
         # First use our defaults passed when registering the rule
         url_items = dict((key, val) for key, val in self._options.items()
-                         if key in self._keywords)
+                         if key in self._keyword_set)
 
-        # Now update with any items explicitly passed to url_for
-        url_items.update((key, val) for key, val in items.items()
-                         if key in self._keywords)
+        # PATCH: split the items between path and query string in one pass,
+        # converting any ints and longs to strings on the way
+        qs_items = {}
+        for key, val in items.iteritems():
+            if isinstance(val, (int, long)):
+                val = str(val)
+            if key in self._keyword_set:
+                url_items[key] = val
+            else:
+                qs_items[key] = val
 
         # Create the path
         path = self._make_path(url_items)
 
         # Extra arguments get tacked on to the query string
-        qs_items = dict((key, val) for key, val in items.items()
-                        if key not in self._keywords)
-        qs = self._make_qs(qs_items)
+        qs = qs_items and self._make_qs(qs_items)
 
         if qs:
             return '?'.join([path, qs])
@@ -183,6 +192,12 @@ class UrlRule(object):
         '''The url pattern'''
         return self._url_format
 
+    @property
+    def first_segment(self):
+        '''The literal first path segment of this url rule, or None if it is
+        a variable.'''
+        return self._first_segment
+
     @property
     def name(self):
         '''The name of this url rule.'''
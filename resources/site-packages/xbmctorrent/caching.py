@@ -18,6 +18,9 @@ if PLATFORM["os"] == "android":
     _Database._chmod = _new_chmod
 
 LOCKS = {}
+PREFETCH_TTL = 10 * 60 # 10 minutes
+PREFETCH_JOIN_TIMEOUT = 30
+PREFETCH_THREADS = []
 
 CACHE_DIR = xbmc.translatePath("special://profile/addon_data/%s/cache" % plugin.id)
 if not os.path.exists(CACHE_DIR):
@@ -27,7 +30,7 @@ if not os.path.exists(CACHE_DIR):
 def shelf(filename, ttl=0):
     import shelve
     filename = os.path.join(CACHE_DIR, filename)
-    with LOCKS.get(filename, threading.RLock()):
+    with LOCKS.setdefault(filename, threading.RLock()):
         with closing(shelve.open(filename, writeback=True)) as d:
             import time
             if not d:
@@ -36,6 +39,7 @@ def shelf(filename, ttl=0):
                     "data": {},
                 })
             elif ttl > 0 and (time.time() - d["created_at"]) > ttl:
+                d["created_at"] = time.time()
                 d["data"] = {}
             yield d["data"]
 
@@ -46,7 +50,10 @@ def cached_route(*args, **kwargs):
         @wraps(fn)
         def _fn(*a, **kwds):
             import hashlib
-            basename = "xbmctorrent.route.%s" % hashlib.sha1(plugin.request.path).hexdigest()
+            # Views may pop arguments off the request, so look at it first
+            content_type = kwargs.get("content_type") or plugin.request.args_dict.get("content_type")
+            route = "%s?%s" % (plugin.request.path, plugin.request.query_string)
+            basename = "xbmctorrent.route.%s" % hashlib.sha1(route).hexdigest()
             with shelf(basename, ttl=kwargs.get("ttl") or 0) as result:
                 if not result.get("value"):
                     ret = fn(*a, **kwds)
@@ -54,10 +61,82 @@ def cached_route(*args, **kwargs):
                     if isinstance(ret, types.GeneratorType):
                         ret = list(ret)
                     result["value"] = ret
-                if kwargs.get("content_type"):
-                    plugin.set_content(kwargs.get("content_type"))
+                if content_type:
+                    plugin.set_content(content_type)
                 return result["value"]
         return _fn
     if len(args) == 1 and callable(args[0]):
         return cached(args[0])
     return cached
+
+
+def prefetchable(*args, **kwargs):
+    """Lets fn.prefetch(*a) compute fn(*a) in a background thread, and store it
+    for the next fn(*a) call to pick up, even from the next plugin invocation.
+    The optional warm callable is run on prefetched values, to fill other
+    caches (TMDB...) along with them."""
+    from functools import wraps
+    def prefetching(fn):
+        def _key(a, kwds):
+            import hashlib
+            return hashlib.sha1(repr((fn.__module__, fn.__name__, a, sorted(kwds.items())))).hexdigest()
+
+        @wraps(fn)
+        def _fn(*a, **kwds):
+            import time
+            if not plugin.get_setting("prefetch", bool):
+                return fn(*a, **kwds)
+            with shelf("xbmctorrent.prefetch") as prefetched:
+                entry = prefetched.pop(_key(a, kwds), None)
+            if entry and (time.time() - entry["prefetched_at"]) < PREFETCH_TTL:
+                plugin.log.info("Using prefetched %s%s" % (fn.__name__, repr(a)))
+                return entry["value"]
+            return fn(*a, **kwds)
+
+        def _prefetch(*a, **kwds):
+            if not plugin.get_setting("prefetch", bool):
+                return
+            def _run():
+                import time
+                try:
+                    value = fn(*a, **kwds)
+                    if not value:
+                        return # Past the last page
+                    if kwargs.get("warm"):
+                        kwargs["warm"](value)
+                    now = time.time()
+                    with shelf("xbmctorrent.prefetch") as prefetched:
+                        for key, entry in prefetched.items():
+                            if (now - entry["prefetched_at"]) >= PREFETCH_TTL:
+                                del prefetched[key]
+                        prefetched[_key(a, kwds)] = {"value": value, "prefetched_at": now}
+                except Exception:
+                    import traceback
+                    plugin.log.error("Prefetching %s%s failed." % (fn.__name__, repr(a)))
+                    map(plugin.log.error, traceback.format_exc().split("\n"))
+            plugin.log.info("Prefetching %s%s" % (fn.__name__, repr(a)))
+            in_background(_run)
+
+        _fn.prefetch = _prefetch
+        return _fn
+    if len(args) == 1 and callable(args[0]):
+        return prefetching(args[0])
+    return prefetching
+
+
+def in_background(fn, *args):
+    """Runs fn(*args) in a daemon thread, which join_prefetches waits for."""
+    thread = threading.Thread(target=fn, args=args)
+    thread.daemon = True
+    thread.start()
+    PREFETCH_THREADS[:] = [t for t in PREFETCH_THREADS if t.is_alive()] + [thread]
+    return thread
+
+
+def join_prefetches(timeout=PREFETCH_JOIN_TIMEOUT):
+    """Waits up to timeout seconds in all for the running prefetches (and
+    other in_background work) to be stored."""
+    import time
+    deadline = time.time() + timeout
+    while PREFETCH_THREADS:
+        PREFETCH_THREADS.pop().join(max(0, deadline - time.time()))
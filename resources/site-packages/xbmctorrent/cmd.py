@@ -20,6 +20,61 @@ def clear_cache():
     plugin.notify("Cache cleared.")
 
 
+@plugin.route("/cmd/mirrors")
+def mirrors_health():
+    from xbmctorrent.mirrors import get_health_table, is_healthy, error_rate, percentile
+    for site, mirror, stats in get_health_table():
+        if not stats:
+            status = "no data"
+        else:
+            status = "p50:%dms p90:%dms errors:%d%%%s" % (
+                (percentile(stats["latencies"], 0.5) or 0) * 1000,
+                (percentile(stats["latencies"], 0.9) or 0) * 1000,
+                error_rate(stats) * 100,
+                not is_healthy(stats) and " DOWN" or "",
+            )
+        yield {
+            "label": "%s - %s (%s)" % (site, mirror, status),
+            "path": plugin.url_for("mirrors_health"),
+        }
+
+
+@plugin.route("/cmd/trackers")
+def trackers_health():
+    from xbmctorrent.trackers import get_health_table
+    for tracker, stats in get_health_table():
+        if not stats:
+            status = "no data"
+        elif stats["latency"] is None:
+            status = "DOWN"
+        else:
+            status = "%dms" % (stats["latency"] * 1000)
+        yield {
+            "label": "%s (%s)" % (tracker, status),
+            "path": plugin.url_for("trackers_health"),
+        }
+
+
+@plugin.route("/cmd/storage")
+def downloads_storage():
+    import time
+    from xbmctorrent.downloads import get_quota, get_usage
+    usage = get_usage()
+    quota = get_quota()
+    yield {
+        "label": "Total: %.1f GB%s" % (
+            sum(size for digest, entry, size in usage) / 1073741824.0,
+            quota and " of %.1f GB" % (quota / 1073741824.0) or "",
+        ),
+        "path": plugin.url_for("downloads_storage"),
+    }
+    for digest, entry, size in usage:
+        yield {
+            "label": "%s (%.1f MB, played %s)" % (entry["name"], size / 1048576.0, time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_played"]))),
+            "path": plugin.url_for("downloads_storage"),
+        }
+
+
 firstrun_file = os.path.join(plugin.addon.getAddonInfo("path"), ".firstrun")
 if not os.path.exists(firstrun_file):
     with open(firstrun_file, "w"):
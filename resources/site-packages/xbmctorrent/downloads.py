@@ -0,0 +1,88 @@
+import os
+import time
+from xbmctorrent import plugin
+from xbmctorrent.caching import shelf
+
+
+def get_quota():
+    """Returns the download path quota in bytes, 0 if there is none."""
+    try:
+        return int(float(plugin.get_setting("dlpath_quota") or 0) * 1024 * 1024 * 1024)
+    except ValueError:
+        return 0
+
+
+def _paths(entry):
+    """Returns the top level files and directories of a download, if they're in its dlpath."""
+    if not os.path.isabs(entry["dlpath"]):
+        return # Relative to some other working directory, don't guess
+    dlpath = os.path.realpath(entry["dlpath"])
+    for name in entry["names"]:
+        path = os.path.realpath(os.path.join(dlpath, name))
+        if path.startswith(os.path.join(dlpath, "")) and os.path.exists(path):
+            yield path
+
+
+def get_size(entry):
+    size = 0
+    for path in _paths(entry):
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        else:
+            size += os.path.getsize(path)
+    return size
+
+
+def record(digest, name, dlpath, files):
+    """Remembers the torrent digest kept in dlpath, with files as listed by
+    torrent2http, as just played. A relative dlpath is relative to the
+    directory torrent2http runs in."""
+    from xbmctorrent.torrent2http import get_torrent2http_binary
+    torrent2http_dir = get_torrent2http_binary()[0]
+    with shelf("xbmctorrent.downloads") as downloads:
+        downloads[digest] = {
+            "name": name,
+            "dlpath": os.path.abspath(os.path.join(torrent2http_dir, dlpath)),
+            "names": sorted(set(os.path.normpath(f).split(os.sep)[0] for f in files)),
+            "last_played": time.time(),
+        }
+
+
+def get_usage():
+    """Returns (digest, entry, size) for all the kept downloads, most recently played first."""
+    with shelf("xbmctorrent.downloads") as downloads:
+        entries = sorted(downloads.items(), key=lambda (digest, entry): entry["last_played"], reverse=True)
+    return [(digest, entry, get_size(entry)) for digest, entry in entries]
+
+
+def evict(protect=()):
+    """Deletes the least recently played downloads until under quota, except protected digests."""
+    import shutil
+    from xbmctorrent.caching import CACHE_DIR
+
+    quota = get_quota()
+    if not quota:
+        return
+    usage = get_usage()
+    total = sum(size for digest, entry, size in usage)
+    for digest, entry, size in reversed(usage):
+        if total <= quota:
+            break
+        if digest in protect:
+            continue
+        plugin.log.info("Download quota exceeded, deleting %s" % entry["name"])
+        for path in _paths(entry):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError: # Still open on Windows?
+                    plugin.log.info("Could not delete %s" % path)
+        resume_file = os.path.join(CACHE_DIR, "resume", "%s.fastresume" % digest)
+        if os.path.exists(resume_file):
+            os.remove(resume_file)
+        with shelf("xbmctorrent.downloads") as downloads:
+            downloads.pop(digest, None)
+        total -= size
@@ -1,9 +1,18 @@
+import os
+import time
+import threading
 from xbmctorrent import plugin
+from xbmctorrent.caching import CACHE_DIR
 from functools import wraps
 import xbmc
 
 
 TRACKING_ID = "UA-40799149-3"
+SPOOL_FILE = os.path.join(CACHE_DIR, "ga.spool")
+CLAIM_TIMEOUT = 5 * 60 # Hits claimed by a worker which died are sent again after 5 minutes
+MAX_SPOOLED_HITS = 500
+SPOOL_LOCK = threading.Lock()
+FLUSH_LOCK = threading.Lock()
 
 
 def make_visitor():
@@ -60,27 +69,112 @@ def tracked(*args, **kwargs):
     return _track
 
 
-def track_page(path, force=False):
-    if not plugin.get_setting("ga_disable", bool) or force:
+def spool(hit):
+    """Appends a hit to the spool file, and lets a background worker send it."""
+    import json
+    try:
+        with SPOOL_LOCK:
+            with open(SPOOL_FILE, "a") as fp:
+                fp.write("%s\n" % json.dumps(hit))
+    except Exception, e:
+        plugin.log.error("GA: Unable to spool hit: %s" % e)
+        return
+    worker = threading.Thread(target=flush, name="ga")
+    worker.daemon = True # Unsent hits stay spooled for the next invocation
+    worker.start()
+
+
+def claim_spool():
+    """Renames the spool files we should send to our own name, so that no other
+    worker sends them too. Returns the hits they contain, and the claimed
+    files, to delete once the hits are sent."""
+    import json
+    import glob
+    hits = []
+    claimed_files = []
+    for i, filename in enumerate(glob.glob("%s*" % SPOOL_FILE)):
+        if filename != SPOOL_FILE and (time.time() - os.path.getmtime(filename)) < CLAIM_TIMEOUT:
+            continue
+        claimed = "%s.%d.%d.%d" % (SPOOL_FILE, os.getpid(), threading.current_thread().ident, i)
+        try:
+            os.rename(filename, claimed)
+            os.utime(claimed, None)
+        except OSError:
+            continue
+        with open(claimed) as fp:
+            hits.extend(json.loads(line) for line in fp if line.strip())
+        claimed_files.append(claimed)
+    return hits[-MAX_SPOOLED_HITS:], claimed_files
+
+
+def remove_claimed(claimed_files):
+    for claimed in claimed_files:
         try:
-            from pyga.requests import Page
+            os.remove(claimed)
+        except OSError:
+            pass
+
+
+def send_hit(tracker, session, visitor, hit):
+    """Sends a spooled hit. Only raises for errors worth trying again later:
+    hits GA can't take are dropped."""
+    import urllib2
+    from pyga.requests import Page, Event
+    try:
+        if hit["type"] == "page":
+            plugin.log.info("GA: Tracking %s" % hit["path"])
+            tracker.track_pageview(Page(hit["path"]), session, visitor)
+        else:
+            plugin.log.info("GA: Tracking event %s" % repr(hit["args"]))
+            tracker.track_event(Event(*hit["args"], **hit["kwargs"]), session, visitor)
+    except urllib2.HTTPError, e:
+        if e.code >= 500:
+            raise
+        plugin.log.error("GA: Dropping hit %s: %s" % (repr(hit), e))
+    except (urllib2.URLError, IOError):
+        raise # Network errors (sockets, timeouts...)
+    except Exception, e:
+        plugin.log.error("GA: Dropping hit %s: %s" % (repr(hit), e))
+
+
+def flush():
+    """Sends all the spooled hits in one batch, sharing the tracker and session.
+    Spool files are only deleted once their hits are sent, so that a worker
+    killed on exit leaves them for the next one. Hits which could not be
+    sent because of the network are spooled again, for the next flush."""
+    import json
+    if not FLUSH_LOCK.acquire(False):
+        return # a worker is already flushing, it will see our hit
+    hits = []
+    claimed_files = []
+    try:
+        hits, claimed_files = claim_spool()
+        if hits:
             tracker, session, visitor = get_ga()
-            plugin.log.info("GA: Tracking %s" % path)
-            tracker.track_pageview(Page(path), session, visitor)
-        except Exception, e:
-            import traceback
-            plugin.log.error("GA: Call failed.")
-            plugin.log.error(traceback.format_exc())
+        while hits:
+            send_hit(tracker, session, visitor, hits[0])
+            hits = hits[1:]
+            if not hits:
+                remove_claimed(claimed_files)
+                hits, claimed_files = claim_spool() # Pick up hits spooled meanwhile
+        remove_claimed(claimed_files)
+    except Exception:
+        import traceback
+        plugin.log.error("GA: Call failed, keeping %d hits for later." % len(hits))
+        plugin.log.error(traceback.format_exc())
+        with SPOOL_LOCK:
+            with open(SPOOL_FILE, "a") as fp:
+                fp.writelines("%s\n" % json.dumps(hit) for hit in hits)
+        remove_claimed(claimed_files)
+    finally:
+        FLUSH_LOCK.release()
+
+
+def track_page(path, force=False):
+    if not plugin.get_setting("ga_disable", bool) or force:
+        spool({"type": "page", "path": path})
 
 
 def track_event(*args, **kwargs):
     if not plugin.get_setting("ga_disable", bool) or kwargs.pop("force", False):
-        try:
-            from pyga.requests import Event
-            tracker, session, visitor = get_ga()
-            plugin.log.info("GA: Tracking event %s" % repr(args))
-            tracker.track_event(Event(*args, **kwargs), session, visitor)
-        except Exception, e:
-            import traceback
-            plugin.log.error("GA: Call failed.")
-            plugin.log.error(traceback.format_exc())
+        spool({"type": "event", "args": args, "kwargs": kwargs})
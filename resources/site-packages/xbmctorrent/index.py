@@ -1,17 +1,8 @@
-from xbmctorrent import plugin, magnet, scrapers
+from xbmctorrent import plugin, magnet
 from xbmctorrent.ga import tracked
 from xbmctorrent.utils import ensure_fanart
 from xbmctorrent.platform import PLATFORM
-from xbmctorrent.scrapers import \
-    MODULES, \
-    eztv, \
-    yify, \
-    kickass, \
-    tpb, \
-    btdigg, \
-    bitsnoop, \
-    extratorrent, \
-    nyaa
+from xbmctorrent.scrapers import MODULES, get_image
 
 
 @plugin.route("/")
@@ -24,6 +15,6 @@ def index():
     for module in MODULES:
         yield {
             "label": module["name"],
-            "thumbnail": module["image"],
-            "path": plugin.url_for(module["view"]),
+            "thumbnail": get_image(module),
+            "path": "plugin://%s%s" % (plugin.id, module["path"]),
         }
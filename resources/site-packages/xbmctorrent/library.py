@@ -58,7 +58,8 @@ def library_add(content_type):
                 return
 
             real_path = xbmc.translatePath(entry["strPath"])
-            uri = unquote(plugin.request.args_dict["href"].replace(play_url, ""))
+            # Drop the play arguments (season, episode...), the .strm only needs the uri
+            uri = unquote(plugin.request.args_dict["href"].replace(play_url, "").split("?")[0])
             magnet_uri = ensure_magnet(uri)
             filename = display_name(magnet_uri)
             if not filename:
@@ -8,32 +8,172 @@ PUBLIC_TRACKERS = [
     "udp://tracker.istole.it:6969",
     "udp://tracker.coppersurfer.tk:80",
 ]
+MAX_NEXT_EPISODES = 500
+MAX_CACHED_TORRENTS = 500
+MAX_TORRENT_URLS = 1000
+CONVERT_WORKERS = 5
+TORRENT_URL_TIMEOUT = 10
 
 
-# Add default trackers to a magnet link, to improve its reachability
+# Add the best known trackers to a magnet link, to improve its reachability
 def _boost_magnet(magnet):
     from urllib import urlencode
-    return "%s&%s" % (magnet, urlencode({"tr": PUBLIC_TRACKERS}, True))
+    from xbmctorrent.trackers import get_best_trackers
+    trackers = [tracker for tracker in get_best_trackers() if urlencode({"tr": tracker}) not in magnet]
+    if not trackers:
+        return magnet
+    return "%s&%s" % (magnet, urlencode({"tr": trackers}, True))
 
 
-def from_torrent_url(url):
+def boost(uri):
+    if uri.startswith("magnet:") and plugin.get_setting("magnet_boost", bool):
+        plugin.log.info("Enabled magnet booster")
+        uri = _boost_magnet(uri)
+    return uri
+
+
+def resolve(uri):
+    """Returns uri as torrent2http should get it: our cached .torrent if we
+    have one, so it can skip downloading the metadata, else the boosted magnet.
+    .torrent urls we can't fetch are left for torrent2http to try."""
+    if uri.startswith(("http://", "https://")):
+        try:
+            uri = from_torrent_url(uri) # Caches the .torrent on the way
+        except Exception, e:
+            plugin.log.info("Could not convert %s: %s" % (uri, e))
+            return uri
+    return cached_torrent(uri) or boost(uri)
+
+
+def info_hash(uri):
+    """Returns the hex info-hash of a magnet uri, or of one of our cached
+    .torrent files, None if it has none."""
+    import re
+    import base64
+    match = re.search(r"xt=urn:btih:([0-9a-zA-Z]+)", uri)
+    if match:
+        digest = match.group(1)
+        if len(digest) == 32:
+            return base64.b32decode(digest.upper()).encode("hex")
+        if len(digest) == 40:
+            return digest.lower()
+    match = re.search(r"\b([0-9a-f]{40})\.torrent$", uri)
+    if match:
+        return match.group(1)
+
+
+def _torrent_path(digest):
+    import os
+    from xbmctorrent.caching import CACHE_DIR
+    return os.path.join(CACHE_DIR, "torrents", "%s.torrent" % digest)
+
+
+def store_torrent(digest, torrent_data):
+    """Keeps torrent_data for its (hex) info-hash, forgetting the least
+    recently used ones past MAX_CACHED_TORRENTS."""
+    import os
+    path = _torrent_path(digest)
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open("%s.tmp" % path, "wb") as fp:
+        fp.write(torrent_data)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename("%s.tmp" % path, path)
+
+    torrents = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".torrent")]
+    for old_path in sorted(torrents, key=os.path.getmtime)[:-MAX_CACHED_TORRENTS]:
+        os.remove(old_path)
+
+
+def cached_torrent(uri):
+    """Returns the file:// uri of the cached .torrent of a magnet uri, if any."""
+    import os
+    import urllib
+    import urlparse
+    digest = info_hash(uri)
+    if digest:
+        path = _torrent_path(digest)
+        if os.path.exists(path):
+            os.utime(path, None)
+            return urlparse.urljoin("file:", urllib.pathname2url(path))
+
+
+def set_next_episodes(next_episodes):
+    """Remembers the episode (uri, season, episode, label) following each uri of next_episodes."""
+    import time
+    from xbmctorrent.caching import shelf
+    with shelf("xbmctorrent.next_episodes") as episodes:
+        for uri, next_episode in next_episodes.items():
+            episodes[uri] = dict(next_episode, time=time.time())
+        for uri in sorted(episodes, key=lambda uri: episodes[uri]["time"])[:-MAX_NEXT_EPISODES]:
+            del episodes[uri]
+
+
+def get_next_episode(uri):
+    from xbmctorrent.caching import shelf
+    with shelf("xbmctorrent.next_episodes") as episodes:
+        return episodes.get(uri)
+
+
+def _make_magnet(digest, name, trackers):
     import base64
-    import bencode
-    import hashlib
     import urllib
+    params = urllib.urlencode({"dn": name, "tr": trackers}, True)
+    return "magnet:?xt=urn:btih:%s&%s" % (base64.b32encode(digest.decode("hex")), params)
+
+
+def cached_magnets(urls):
+    """Returns url -> magnet for the .torrent urls we already converted, without downloading anything."""
+    from xbmctorrent.caching import shelf
+    with shelf("xbmctorrent.torrent_urls") as converted:
+        return dict((url, _make_magnet(**converted[url]["torrent"])) for url in urls if url in converted)
+
+
+def from_torrent_url(url):
+    import time
+    from xbmctorrent import metainfo
+    from xbmctorrent.caching import shelf
     from xbmctorrent.utils import url_get
-    torrent_data = url_get(url)
-    metadata = bencode.bdecode(torrent_data)
-    hashcontents = bencode.bencode(metadata['info'])
-    digest = hashlib.sha1(hashcontents).digest()
-    b32hash = base64.b32encode(digest)
-    params = {
-        'dn': metadata['info']['name'],
-        'tr': metadata['announce'],
+
+    magnet = cached_magnets([url]).get(url)
+    if magnet:
+        return magnet
+
+    torrent_data = url_get(url, timeout=TORRENT_URL_TIMEOUT)
+    if torrent_data is None:
+        raise IOError("Could not fetch %s" % url)
+    metadata, digest = metainfo.parse(torrent_data)
+    store_torrent(digest, torrent_data)
+    trackers = []
+    for tracker in [metadata.get("announce")] + sum(metadata.get("announce-list", []), []):
+        if tracker and tracker not in trackers:
+            trackers.append(tracker)
+    torrent = {
+        "digest": digest,
+        "name": metadata["info"]["name"],
+        "trackers": trackers,
     }
-    plugin.log.info(params)
-    paramstr = urllib.urlencode(params)
-    return 'magnet:?%s&%s' % ('xt=urn:btih:%s' % b32hash, paramstr)
+    plugin.log.info(torrent)
+    with shelf("xbmctorrent.torrent_urls") as converted:
+        converted[url] = {"torrent": torrent, "time": time.time()}
+        for old_url in sorted(converted, key=lambda url: converted[url]["time"])[:-MAX_TORRENT_URLS]:
+            del converted[old_url]
+    return _make_magnet(**torrent)
+
+
+def from_torrent_urls(urls):
+    """Converts .torrent urls to magnets concurrently. Returns url -> magnet, None if it failed."""
+    from concurrent import futures
+    def _convert(url):
+        try:
+            return from_torrent_url(url)
+        except Exception, e:
+            plugin.log.info("Could not convert %s: %s" % (url, e))
+    urls = list(set(urls))
+    with futures.ThreadPoolExecutor(max_workers=CONVERT_WORKERS) as pool:
+        return dict(zip(urls, pool.map(_convert, urls)))
 
 
 def ensure_magnet(uri):
@@ -52,7 +192,51 @@ def display_name(magnet_uri):
 @plugin.route("/play/<uri>")
 def play(uri):
     from xbmctorrent.player import TorrentPlayer
-    if uri.startswith("magnet:") and plugin.get_setting("magnet_boost", bool):
-        plugin.log.info("Enabled magnet booster")
-        uri = _boost_magnet(uri)
-    TorrentPlayer().init(uri).loop()
+    next_episode = plugin.get_setting("prefetch_next", bool) and get_next_episode(uri) or None
+    season = plugin.request.args_dict.get("season")
+    episode = plugin.request.args_dict.get("episode")
+    file_index = plugin.request.args_dict.get("file_index")
+    TorrentPlayer().init(resolve(uri),
+        season=season and int(season),
+        episode=episode and int(episode),
+        file_index=file_index and int(file_index),
+        next_episode=next_episode,
+    ).loop()
+
+
+def pack_context_menu(name, uri):
+    """Returns the context menu to browse the episodes of name, if it's a season pack."""
+    from xbmctorrent.utils import get_season_pack_from_name
+    if get_season_pack_from_name(name) is not None:
+        return [("Browse episodes", "Container.Update(%s)" % plugin.url_for("pack_files", uri=uri))]
+    return []
+
+
+@plugin.route("/pack/<uri>")
+def pack_files(uri):
+    import os
+    import re
+    from xbmctorrent.player import get_files, VIDEO_EXTENSIONS, SAMPLE_RE
+    from xbmctorrent.utils import get_show_info_from_name
+
+    plugin.set_content("episodes")
+    files = get_files(uri)
+    if files is None:
+        return
+    for index, f in sorted(enumerate(files), key=lambda (index, f): f["name"]):
+        name = os.path.basename(f["name"])
+        if not name.lower().endswith(VIDEO_EXTENSIONS) or re.search(SAMPLE_RE, f["name"]):
+            continue
+        item = {
+            "label": "%s (%.1f MB)" % (name, f["size"] / 1048576.0),
+            "path": plugin.url_for("play", uri=uri, file_index=index),
+            "is_playable": True,
+        }
+        show_info = get_show_info_from_name(name)
+        if show_info:
+            item["info"] = {
+                "title": name,
+                "season": show_info["season"],
+                "episode": show_info["episode"],
+            }
+        yield item
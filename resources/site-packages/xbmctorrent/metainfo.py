@@ -0,0 +1,89 @@
+import hashlib
+
+
+# Strings this long (piece hashes...) are returned as buffers over the
+# original data instead of copies.
+BUFFER_MIN_LENGTH = 1024
+
+
+class MetainfoError(ValueError):
+    pass
+
+
+def decode(data):
+    """Decodes bencoded data, without recursion. Returns the value, and the
+    (start, end) offsets of the top level "info" dict in data, if any."""
+    index = data.index
+    end = len(data)
+    pos = 0
+    # The container being filled, and its pending dict key. Parents go on stack.
+    stack = []
+    top = key = None
+    info_start = info_span = None
+    try:
+        while True:
+            token = data[pos]
+            if token == "e":
+                if top is None or key is not None:
+                    raise MetainfoError("Unexpected end at %d" % pos)
+                pos += 1
+                value = top
+                if len(stack) == 2 and stack[-1][1] == "info":
+                    info_span = (info_start, pos)
+                top, key = stack.pop()
+            elif token == "d" or token == "l":
+                if top is not None and len(stack) == 1 and key == "info":
+                    info_start = pos
+                stack.append((top, key))
+                if token == "d":
+                    top = {}
+                else:
+                    top = []
+                key = None
+                pos += 1
+                continue
+            elif token == "i":
+                value_end = index("e", pos)
+                value = int(data[pos + 1:value_end])
+                pos = value_end + 1
+            else:
+                colon = index(":", pos)
+                length = int(data[pos:colon])
+                if length < 0:
+                    raise MetainfoError("Invalid string length at %d" % pos)
+                pos = colon + 1 + length
+                if pos > end:
+                    raise MetainfoError("Truncated string at %d" % colon)
+                if length >= BUFFER_MIN_LENGTH:
+                    value = buffer(data, colon + 1, length)
+                else:
+                    value = data[colon + 1:pos]
+
+            if top is None:
+                break
+            if top.__class__ is list:
+                top.append(value)
+            elif key is None:
+                if value.__class__ is not str:
+                    raise MetainfoError("Dict key isn't a string at %d" % pos)
+                key = value
+            else:
+                top[key] = value
+                key = None
+    except MetainfoError:
+        raise
+    except (IndexError, ValueError), e:
+        raise MetainfoError("Invalid bencoded data: %s" % e)
+    if pos != end:
+        raise MetainfoError("Invalid bencoded data: data after value")
+    return value, info_span
+
+
+def parse(torrent_data):
+    """Returns the metadata of a .torrent, and its (hex) info-hash, hashed
+    straight from the bytes of its info dict."""
+    metadata, info_span = decode(torrent_data)
+    if not isinstance(metadata, dict) or not info_span:
+        raise MetainfoError("No info dict")
+    start, end = info_span
+    return metadata, hashlib.sha1(buffer(torrent_data, start, end - start)).hexdigest()
@@ -0,0 +1,137 @@
+import time
+import threading
+from xbmctorrent import plugin
+from xbmctorrent.caching import shelf
+
+
+SETTINGS = [
+    ("EZTV", "base_eztv", "http://eztv.it"),
+    ("YIFY Torrents", "base_yify", "http://yts.re"),
+    ("Kickass Torrents", "base_kickass", "http://kickass.to"),
+    ("The Pirate Bay", "base_tpb", "http://thepiratebay.org"),
+    ("NyaaTorrents", "base_nyaa", "http://www.nyaa.se"),
+    ("BitSnoop", "base_bitsnoop", "http://bitsnoop.com"),
+    ("ExtraTorrent", "base_extratorrent", "http://extratorrent.cc"),
+    ("BTDigg", "base_btdigg", "http://btdigg.org"),
+]
+HEALTH_SAMPLES = 20
+MAX_ERROR_RATE = 0.5
+RETRY_DELAY = 10 * 60 # Try failing mirrors again after 10 minutes
+PROBE_INTERVAL = 30 * 60 # Probe mirrors unused for 30 minutes again, in the background
+TIMEOUT = 10
+
+_probing = threading.Lock()
+
+
+def from_setting(setting):
+    """Returns the mirrors of a comma separated base_* setting, in order of
+    preference. Falls back on the default mirror when the setting is empty."""
+    mirrors = filter(None, [mirror.strip().rstrip("/") for mirror in plugin.get_setting(setting).split(",")])
+    return mirrors or [default for site, name, default in SETTINGS if name == setting]
+
+
+def percentile(values, p):
+    if values:
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def error_rate(stats):
+    return stats["errors"] and float(sum(stats["errors"])) / len(stats["errors"]) or 0.0
+
+
+def is_healthy(stats):
+    return error_rate(stats) <= MAX_ERROR_RATE or (time.time() - stats["last_error"]) > RETRY_DELAY
+
+
+def probe(mirrors):
+    """Fetches the home page of mirrors, recording how they do."""
+    from xbmctorrent import utils
+    for mirror in mirrors:
+        start = time.time()
+        try:
+            utils.url_get("%s/" % mirror, timeout=TIMEOUT)
+        except Exception, e:
+            plugin.log.info("Mirror %s is down: %s" % (mirror, e))
+            record(mirror)
+        else:
+            record(mirror, time.time() - start)
+
+
+def rank(mirrors):
+    """Sorts mirrors by health, then latency, the ones we know nothing about
+    between the healthy and unhealthy ones. Mirrors we know nothing recent
+    about are probed in the background, for next time."""
+    now = time.time()
+    with shelf("xbmctorrent.mirrors") as health:
+        stats = dict((mirror, health.get(mirror)) for mirror in mirrors)
+    stale = [mirror for mirror in mirrors if not stats[mirror] or (now - stats[mirror]["last_used"]) > PROBE_INTERVAL]
+    if stale and len(mirrors) > 1:
+        from xbmctorrent.utils import run_in_background
+        run_in_background(_probing, probe, stale)
+
+    def _key(entry):
+        index, mirror = entry
+        if not stats[mirror]:
+            return (1, 0, index)
+        if not is_healthy(stats[mirror]):
+            return (2, 0, index)
+        return (0, percentile(stats[mirror]["latencies"], 0.5) or 0, index)
+    return [mirror for index, mirror in sorted(enumerate(mirrors), key=_key)]
+
+
+def record(mirror, latency=None):
+    """Records a request to a mirror, failed if latency is None."""
+    with shelf("xbmctorrent.mirrors") as health:
+        stats = health.get(mirror) or {"latencies": [], "errors": [], "last_error": 0}
+        stats["last_used"] = time.time()
+        stats["errors"] = (stats["errors"] + [latency is None])[-HEALTH_SAMPLES:]
+        if latency is None:
+            stats["last_error"] = stats["last_used"]
+        else:
+            stats["latencies"] = (stats["latencies"] + [latency])[-HEALTH_SAMPLES:]
+        health[mirror] = stats
+
+
+def url_get(mirrors, path, params={}, headers={}):
+    """Fetches path from the best of mirrors, falling back on the next ones
+    when it fails. Only connection errors and timeouts count against a
+    mirror, HTTP errors (404...) mean it's up."""
+    import sys
+    import socket
+    import httplib
+    import urllib2
+    from urlparse import urljoin
+    from xbmctorrent import utils
+
+    exc_info = None
+    answered = False
+    for mirror in rank(mirrors):
+        start = time.time()
+        try:
+            data = utils.url_get(urljoin("%s/" % mirror, path), params=params, headers=dict(headers, Referer="%s/" % mirror), timeout=TIMEOUT)
+        except (urllib2.URLError, socket.error, httplib.HTTPException):
+            exc_info = sys.exc_info()
+            plugin.log.info("Mirror %s failed, trying next one" % mirror)
+            record(mirror)
+            continue
+        record(mirror, time.time() - start)
+        if data is not None:
+            return data
+        plugin.log.info("Mirror %s returned an error, trying next one" % mirror)
+        answered = True
+    if exc_info and not answered:
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+
+def url_get_json(*args, **kwargs):
+    import json
+    data = url_get(*args, **kwargs)
+    return data and json.loads(data) or {}
+
+
+def get_health_table():
+    """Returns (site, mirror, stats) for all configured mirrors, stats being None if never used."""
+    with shelf("xbmctorrent.mirrors") as health:
+        return [(site, mirror, health.get(mirror) and dict(health[mirror]))
+                for site, setting, default in SETTINGS for mirror in from_setting(setting)]
@@ -1,3 +1,4 @@
+from xbmcswift2 import Plugin
 from xbmcswift2.request import Request
 
 
@@ -8,3 +9,12 @@ def init_with_args(self, *args, **kwargs):
     for k, v in self.args.items():
         self.args_dict[k] = v[0]
 Request.__init__ = init_with_args
+
+
+# Scrapers are only imported when one of their routes is requested
+old_dispatch = Plugin._dispatch
+def dispatch_with_scraper(self, path):
+    from xbmctorrent.scrapers import import_module_for
+    import_module_for(path)
+    return old_dispatch(self, path)
+Plugin._dispatch = dispatch_with_scraper
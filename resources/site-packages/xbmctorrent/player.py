@@ -8,15 +8,27 @@ from xbmctorrent import plugin, torrent2http
 from xbmctorrent.common import RESOURCES_PATH
 from xbmctorrent.platform import PLATFORM
 from xbmctorrent.ga import track_event
-from xbmctorrent.utils import url_get_json
 from contextlib import contextmanager, closing, nested
 
 
-TORRENT2HTTP_TIMEOUT = 20
 TORRENT2HTTP_POLL = 1000
+TORRENT2HTTP_MIN_POLL = 100
+TORRENT2HTTP_METADATA_POLL = 250
 PLAYING_EVENT_INTERVAL = 60
 MIN_COMPLETED_PIECES = 0.5
 
+# torrent2http buffers BUFFER_MAX of the file, but we start playing as soon as
+# enough of it is there for the download to keep ahead of the playback.
+BUFFER_MAX = 0.03
+BUFFER_DEFAULT = 0.005 # When we don't know the bitrate
+BUFFER_MIN_SECONDS = 20
+BUFFER_RATE_MARGIN = 1.2
+MAX_PLAYBACK_STATS = 100
+PREFETCH_CHECK_INTERVAL = 30
+
+VIDEO_EXTENSIONS = (".mkv", ".mp4", ".m4v", ".avi", ".mov", ".wmv", ".mpg", ".mpeg", ".ts", ".m2ts", ".flv", ".webm", ".ogm", ".divx", ".vob")
+SAMPLE_RE = r"(?i)(^|[\W_])(sample|trailer|featurette|extras?)([\W_]|$)"
+
 WINDOW_FULLSCREEN_VIDEO = 12005
 
 XBFONT_LEFT = 0x00000000
@@ -77,6 +89,10 @@ class OverlayText(object):
     def close(self):
         self.hide()
 
+    @property
+    def shown(self):
+        return self._shown
+
     @property
     def text(self):
         return self._text
@@ -96,39 +112,153 @@ class OverlayText(object):
         return int(res.attrib["width"]), int(res.attrib["height"])
 
 
+def get_duration():
+    """Returns the duration in seconds of the ListItem being played, if known."""
+    duration = xbmc.getInfoLabel("ListItem.Duration")
+    try:
+        if ":" in duration: # hh:mm:ss
+            return reduce(lambda total, part: total * 60 + int(part), duration.split(":"), 0)
+        return int(duration) * 60 # minutes
+    except ValueError:
+        return None
+
+
+def required_buffer(size, duration, download_rate):
+    """Returns the smallest fraction of the file to buffer before playing, for
+    the download (in bytes/s) to never fall behind the playback."""
+    if not size or not duration:
+        return BUFFER_DEFAULT
+    bitrate = float(size) / duration
+    needed = bitrate * BUFFER_MIN_SECONDS
+    # We lose this many bytes of buffer per second of playback
+    deficit = bitrate * BUFFER_RATE_MARGIN - download_rate
+    if deficit > 0:
+        needed += deficit * duration
+    return min(needed / size, BUFFER_MAX)
+
+
+def get_episode():
+    """Returns the season and episode numbers of the ListItem being played."""
+    try:
+        return int(xbmc.getInfoLabel("ListItem.Season")), int(xbmc.getInfoLabel("ListItem.Episode"))
+    except ValueError:
+        return None, None
+
+
+def select_file(files, season=None, episode=None):
+    """Returns the index of the file to play: the requested episode if any,
+    else the biggest video which isn't a sample or an extra."""
+    import re
+    from xbmctorrent.utils import get_show_info_from_name
+
+    indexes = sorted(range(len(files)), key=lambda i: files[i]["size"], reverse=True)
+    videos = [i for i in indexes if files[i]["name"].lower().endswith(VIDEO_EXTENSIONS)]
+    features = [i for i in videos if not re.search(SAMPLE_RE, files[i]["name"])]
+    candidates = features or videos or indexes
+    if episode is not None:
+        for i in candidates:
+            show_info = get_show_info_from_name(os.path.basename(files[i]["name"]))
+            if show_info and show_info["episode"] == episode and season in (None, show_info["season"]):
+                return i
+    return candidates[0]
+
+
+def record_playback_stats(stats):
+    from xbmctorrent.caching import shelf
+    plugin.log.info("Playback stats: %s" % repr(stats))
+    with shelf("xbmctorrent.playback_stats") as playback_stats:
+        playback_stats["sessions"] = (playback_stats.get("sessions", []) + [stats])[-MAX_PLAYBACK_STATS:]
+
+
+def get_torrent2http_options(uri):
+    options = {
+        "uri": uri,
+        "dlpath": xbmc.validatePath(xbmc.translatePath(plugin.get_setting("dlpath"))) or ".",
+        "dlrate": plugin.get_setting("max_download_rate") or "0",
+        "encryption": plugin.get_setting("encryption"),
+        "buffer": str(BUFFER_MAX),
+    }
+
+    if "://" in options["dlpath"]:
+        # Translate smb:// url to UNC path on windows, very hackish
+        if PLATFORM["os"] == "windows" and options["dlpath"].lower().startswith("smb://"):
+            options["dlpath"] = options["dlpath"].replace("smb:", "").replace("/", "\\")
+        else:
+            plugin.notify("Downloading to an unmounted network share is not supported. Resetting.", delay=15000)
+            plugin.set_setting("dlpath", "")
+            options["dlpath"] = "."
+
+    # Check for Android and FAT32 SD card issues
+    if PLATFORM["os"] == "android" and options["dlpath"] != ".":
+        from xbmctorrent.utils import get_path_fs
+        fs = get_path_fs(options["dlpath"])
+        plugin.log.info("Download path filesytem is %s" % fs)
+        if fs == "vfat": # FAT32 is not supported
+            plugin.notify("Downloading to FAT32 is not supported. Resetting.", delay=15000)
+            plugin.set_setting("dlpath", "")
+            options["dlpath"] = "."
+
+    # With a quota, we keep files and delete the least recently played ones ourselves
+    from xbmctorrent.downloads import get_quota
+    if plugin.get_setting("keep_files", bool) or get_quota():
+        from xbmctorrent.magnet import info_hash
+        plugin.log.info("Will keep file after playback.")
+        options["keep"] = None
+        # So that playing it again doesn't check all that was downloaded
+        resume_file = torrent2http.get_option("resume-file", "resume_file")
+        digest = info_hash(uri)
+        if resume_file and digest:
+            options[resume_file] = torrent2http.get_resume_file(digest)
+    return options
+
+
+def get_files(uri):
+    """Returns the files of a torrent, in torrent order, downloading only its
+    metadata (with torrent2http for magnets). None if cancelled or failed."""
+    from xbmctorrent.magnet import resolve
+    from xbmctorrent.utils import SafeDialogProgress
+
+    uri = resolve(uri)
+    if uri.startswith("file:"):
+        import urllib
+        import urlparse
+        from xbmctorrent import metainfo
+        with open(urllib.url2pathname(urlparse.urlparse(uri).path), "rb") as fp:
+            info = metainfo.parse(fp.read())[0]["info"]
+        if "files" in info:
+            return [{"name": "/".join([info["name"]] + f["path"]), "size": f["length"]} for f in info["files"]]
+        return [{"name": info["name"], "size": info["length"]}]
+
+    with closing(torrent2http.start(**get_torrent2http_options(uri))) as t2h_instance:
+        t2h_instance.keep_warm = False # Or it would go on downloading the biggest file
+        if not t2h_instance.ready:
+            return
+        with closing(SafeDialogProgress(delay_create=0)) as dialog:
+            dialog.create(plugin.name)
+            while not xbmc.abortRequested and not dialog.iscanceled():
+                status = t2h_instance.client("status")
+                if status["state"] >= 3:
+                    return t2h_instance.client("ls")["files"]
+                dialog.update(0, status["name"], STATE_STRS[status["state"]])
+                xbmc.sleep(TORRENT2HTTP_METADATA_POLL)
+
+
 class TorrentPlayer(xbmc.Player):
-    def init(self, uri):
+    def init(self, uri, season=None, episode=None, file_index=None, next_episode=None):
         self.display_name = ""
-        self.torrent2http_options = {
-            "uri": uri,
-            "dlpath": xbmc.validatePath(xbmc.translatePath(plugin.get_setting("dlpath"))) or ".",
-            "dlrate": plugin.get_setting("max_download_rate") or "0",
-            "encryption": plugin.get_setting("encryption"),
-            "buffer": "0.005",
-        }
-
-        if "://" in self.torrent2http_options["dlpath"]:
-            # Translate smb:// url to UNC path on windows, very hackish
-            if PLATFORM["os"] == "windows" and self.torrent2http_options["dlpath"].lower().startswith("smb://"):
-                self.torrent2http_options["dlpath"] = self.torrent2http_options["dlpath"].replace("smb:", "").replace("/", "\\")
-            else:
-                plugin.notify("Downloading to an unmounted network share is not supported. Resetting.", delay=15000)
-                plugin.set_setting("dlpath", "")
-                self.torrent2http_options["dlpath"] = "."
-
-        # Check for Android and FAT32 SD card issues
-        if PLATFORM["os"] == "android" and self.torrent2http_options["dlpath"] != ".":
-            from xbmctorrent.utils import get_path_fs
-            fs = get_path_fs(self.torrent2http_options["dlpath"])
-            plugin.log.info("Download path filesytem is %s" % fs)
-            if fs == "vfat": # FAT32 is not supported
-                plugin.notify("Downloading to FAT32 is not supported. Resetting.", delay=15000)
-                plugin.set_setting("dlpath", "")
-                self.torrent2http_options["dlpath"] = "."
-
-        if plugin.get_setting("keep_files", bool):
-            plugin.log.info("Will keep file after playback.")
-            self.torrent2http_options["keep"] = None
+        self.next_episode = next_episode
+        if episode is None and file_index is None:
+            season, episode = get_episode()
+        self.season = season
+        self.episode = episode
+        self.file_index = file_index
+        self.torrent2http_options = get_torrent2http_options(uri)
+
+        # When we know the file already, torrent2http can skip the others from the start
+        file_index_option = torrent2http.get_option("file-index", "file_index")
+        if file_index is not None and file_index_option:
+            self.torrent2http_options[file_index_option] = str(file_index)
+
         self.on_playback_started = []
         self.on_playback_resumed = []
         self.on_playback_paused = []
@@ -162,6 +292,27 @@ class TorrentPlayer(xbmc.Player):
             "D:%(download_rate).2fkB/s U:%(upload_rate).2fkB/s S:%(num_seeds)d (%(total_seeds)s) P:%(num_peers)d (%(total_peers)s)" % status,
         ]
 
+    def prefetch_next_episode(self):
+        """Starts torrent2http on the next episode, to be left warm for when it
+        plays, and queues it in the playlist."""
+        from xbmctorrent.magnet import resolve, info_hash
+        next_episode = self.next_episode
+        plugin.log.info("Prefetching %s" % next_episode["label"])
+        uri = resolve(next_episode["uri"])
+        instance = torrent2http.start(**get_torrent2http_options(uri))
+        instance.digest = info_hash(uri)
+        plugin.add_to_playlist([{
+            "label": next_episode["label"],
+            "path": plugin.url_for("play", uri=next_episode["uri"], season=next_episode["season"], episode=next_episode["episode"]),
+            "info": {
+                "title": next_episode["label"],
+                "season": next_episode["season"],
+                "episode": next_episode["episode"],
+            },
+            "is_playable": True,
+        }])
+        return instance
+
     @contextmanager
     def attach(self, callback, *events):
         for event in events:
@@ -170,27 +321,21 @@ class TorrentPlayer(xbmc.Player):
         for event in events:
             event.remove(callback)
 
-    def _wait_t2h_startup(self, t2h):
-        start = time.time()
-        while (time.time() - start) < TORRENT2HTTP_TIMEOUT:
-            try:
-                t2h("status")
-                return True
-            except:
-                pass
-            xbmc.sleep(TORRENT2HTTP_POLL)
-        return False
-
     def loop(self):
+        from xbmctorrent import downloads
+        from xbmctorrent.magnet import info_hash
         from xbmctorrent.utils import SafeDialogProgress
 
         has_resolved = False
+        started_at = time.time()
 
         plugin.log.info("Starting torrent2http...")
-        with closing(torrent2http.start(**self.torrent2http_options)) as t2h_instance:
-            t2h = lambda cmd: url_get_json("http://%s/%s" % (t2h_instance.bind_address, cmd), with_immunicity=False)
+        t2h_instance = torrent2http.start(**self.torrent2http_options)
+        prefetch_instance = None
+        try:
+            t2h = t2h_instance.client
 
-            if not self._wait_t2h_startup(t2h):
+            if not t2h_instance.ready:
                 return
 
             plugin.log.info("Opening download dialog...")
@@ -198,46 +343,121 @@ class TorrentPlayer(xbmc.Player):
                 dialog.create(plugin.name)
 
                 plugin.log.info("Waiting for file resolution...")
+                selected_name = None
+                last_buffer = None
+                duration = get_duration()
                 while not has_resolved:
                     if xbmc.abortRequested or dialog.iscanceled():
                         return
 
                     status = t2h("status")
                     self.display_name = status["name"]
+                    poll = TORRENT2HTTP_POLL
 
                     if status["state"] < 3:
                         dialog.update(0, *self._get_status_lines(status))
+                        poll = TORRENT2HTTP_METADATA_POLL
                     if status["state"] >= 3 and not has_resolved: # Downloading?
                         files = t2h("ls")["files"]
-                        biggest_file = sorted(files, key=lambda x: x["size"])[-1]
-                        biggest_file["name"] = biggest_file["name"].encode("utf-8")
-                        dialog.update(int(biggest_file["buffer"] * 100.0), *self._get_status_lines(status))
+                        if selected_name is None:
+                            selected = self.file_index
+                            if selected is None or selected >= len(files):
+                                selected = select_file(files, self.season, self.episode)
+                            selected_name = files[selected]["name"]
+                            plugin.log.info("Selected %s" % repr(selected_name))
+                            digest = info_hash(self.torrent2http_options["uri"])
+                            if "keep" in self.torrent2http_options and digest:
+                                downloads.record(digest, status["name"], self.torrent2http_options["dlpath"], [f["name"] for f in files])
+                            # torrent2http buffers the biggest file, unless told otherwise
+                            file_index = torrent2http.get_option("file-index", "file_index")
+                            if file_index and file_index not in self.torrent2http_options and files[selected]["size"] < max(f["size"] for f in files):
+                                plugin.log.info("Restarting torrent2http on file %d" % selected)
+                                t2h_instance.keep_warm = False
+                                t2h_instance.close()
+                                self.torrent2http_options[file_index] = str(selected)
+                                t2h_instance = torrent2http.start(**self.torrent2http_options)
+                                t2h = t2h_instance.client
+                                if not t2h_instance.ready:
+                                    return
+                                continue
+                        selected_file = (f for f in files if f["name"] == selected_name).next()
+                        selected_file["name"] = selected_file["name"].encode("utf-8")
+                        needed = required_buffer(selected_file["size"], duration, status["download_rate"] * 1024)
+                        progress = min(selected_file["buffer"] * BUFFER_MAX / needed, 1.0)
+                        dialog.update(int(progress * 100.0), *self._get_status_lines(status))
+
+                        # Poll faster as the buffer gets close to complete, given how fast it fills
+                        now = time.time()
+                        if last_buffer and progress > last_buffer[1]:
+                            eta = (1.0 - progress) * (now - last_buffer[0]) / (progress - last_buffer[1])
+                            poll = int(min(max(eta * 1000 / 2, TORRENT2HTTP_MIN_POLL), TORRENT2HTTP_POLL))
+                        last_buffer = (now, progress)
 
-                        if biggest_file["buffer"] >= 1.0:
-                            plugin.log.info("Resolving to http://%s/files/%s" % (t2h_instance.bind_address, biggest_file["name"]))
+                        if progress >= 1.0:
+                            plugin.log.info("Resolving to http://%s/files/%s after %.1fs" % (t2h_instance.bind_address, selected_file["name"], time.time() - started_at))
                             has_resolved = True
+                            stats = {
+                                "startup_time": time.time() - started_at,
+                                "size": selected_file["size"],
+                                "duration": duration,
+                                "download_rate": status["download_rate"] * 1024,
+                                "buffer": needed,
+                                "stalls": 0,
+                                "stall_time": 0,
+                            }
                             item = {
-                                "path": "http://%s/files/%s" % (t2h_instance.bind_address, urllib.quote(biggest_file["name"])),
+                                "path": "http://%s/files/%s" % (t2h_instance.bind_address, urllib.quote(selected_file["name"])),
                             }
                             if not xbmc.getInfoLabel("ListItem.Title"):
                                 item["label"] = self.display_name
                             plugin.set_resolved_url(item)
                             break
 
-                    xbmc.sleep(TORRENT2HTTP_POLL)
+                    xbmc.sleep(poll)
 
             # We are now playing
             plugin.log.info("Now playing torrent...")
             last_playing_event = 0
+            last_prefetch_check = time.time()
+            # The prefetch is handed over warm to the next play, which needs --max-idle
+            can_prefetch = self.next_episode and torrent2http.get_option("max-idle", "max_idle")
+            stalled_since = None
+            started_playing = False # Caching before the first frame isn't a stall
             with closing(OverlayText(w=OVERLAY_WIDTH, h=OVERLAY_HEIGHT, alignment=XBFONT_CENTER_X | XBFONT_CENTER_Y)) as overlay:
                 with nested(self.attach(overlay.show, self.on_playback_paused),
                             self.attach(overlay.hide, self.on_playback_resumed, self.on_playback_stopped)):
                     while not xbmc.abortRequested and self.isPlaying():
-                        overlay.text = "\n".join(self._get_status_lines(t2h("status")))
+                        # Only ask torrent2http for its status when it's displayed
+                        if overlay.shown:
+                            overlay.text = "\n".join(self._get_status_lines(t2h("status")))
                         now = time.time()
                         if (now - last_playing_event) > PLAYING_EVENT_INTERVAL:
                             track_event("video", "playing", self.display_name)
                             last_playing_event = now
+                        if can_prefetch and not prefetch_instance and (now - last_prefetch_check) > PREFETCH_CHECK_INTERVAL:
+                            # torrent2http can't be throttled then sped up, so rather than
+                            # sharing bandwidth, wait for this one to be Finished or Seeding
+                            last_prefetch_check = now
+                            if t2h("status")["state"] in (4, 5):
+                                prefetch_instance = self.prefetch_next_episode()
+                        if xbmc.getCondVisibility("Player.Caching"):
+                            if started_playing and stalled_since is None:
+                                stalled_since = now
+                                stats["stalls"] += 1
+                        else:
+                            started_playing = True
+                            if stalled_since is not None:
+                                stats["stall_time"] += now - stalled_since
+                                stalled_since = None
                         xbmc.sleep(TORRENT2HTTP_POLL)
+            record_playback_stats(stats)
+        finally:
+            if prefetch_instance:
+                # The next episode takes the warm spot
+                t2h_instance.keep_warm = False
+            t2h_instance.close()
+            if prefetch_instance:
+                prefetch_instance.close()
+            downloads.evict(protect=[info_hash(self.torrent2http_options["uri"]), prefetch_instance and prefetch_instance.digest])
 
         plugin.log.info("Closing Torrent player.")
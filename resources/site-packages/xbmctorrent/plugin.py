@@ -1,3 +1,6 @@
-from xbmcswift2 import Plugin
+from xbmcswift2 import Plugin, CLI_MODE
 
 plugin = Plugin()
+if not CLI_MODE:
+    from xbmctorrent.settings import SettingsSnapshot
+    plugin._addon = SettingsSnapshot(plugin._addon)
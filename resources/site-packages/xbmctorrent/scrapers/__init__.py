@@ -1,12 +1,44 @@
+import re
 from functools import wraps
 
-MODULES = []
+# Which scraper owns which routes, so that we only import the one we need.
+# Images are relative to the first mirror of "base", when set.
+MODULES = [
+    # Logo found on http://thesimurg.deviantart.com/art/Logo-for-EZTV-57874544
+    {"name": "EZTV - Series", "module": "eztv", "path": "/eztv", "image": "http://i.imgur.com/XcH6WOg.jpg"},
+    {"name": "YIFY Torrents - Movies", "module": "yify", "path": "/yify", "image": "http://fbcdn-sphotos-h-a.akamaihd.net/hphotos-ak-frc3/204323_207963335901313_5804989_o.jpg"},
+    {"name": "Kickass Torrents - Movies, Series, Anime", "module": "kickass", "path": "/kat", "base": "base_kickass", "image": "/content/images/logos/kickasstorrents_500x500.png"},
+    {"name": "The Pirate Bay - Movies and Series", "module": "tpb", "path": "/tpb", "base": "base_tpb", "image": "/static/img/tpb.jpg"},
+    {"name": "BTDigg - DHT Search Engine", "module": "btdigg", "path": "/btdigg", "base": "base_btdigg", "image": "/logo.png"},
+    {"name": "BitSnoop - Search Engine", "module": "bitsnoop", "path": "/bitsnoop", "base": "base_bitsnoop", "image": "/i/logo.png"},
+    {"name": "ExtraTorrent - Movies, Series, Anime", "module": "extratorrent", "path": "/extratorrent", "base": "base_extratorrent", "image": "/images/logo.gif"},
+    {"name": "NyaaTorrents - Anime", "module": "nyaa", "path": "/nyaa", "image": "http://i.imgur.com/P7y2ps2.png"},
+]
+TAGS_RE = re.compile(r"<[^>]+>")
+# Result rows are scanned with patterns instead of building a whole DOM
+MAGNET_RE = re.compile(r'href="(magnet:[^"]+)"')
 
-def scraper(name, image=None):
-    def _decorator(fn):
-        MODULES.append({"name": name, "image": image, "view": fn.__name__})
-        return fn
-    return _decorator
+
+def get_image(module):
+    if module.get("base"):
+        from xbmctorrent.mirrors import from_setting
+        return "%s%s" % (from_setting(module["base"])[0], module["image"])
+    return module["image"]
+
+
+def get_module_for(path):
+    """Returns the MODULES entry of the scraper owning path, if any."""
+    for module in MODULES:
+        if path == module["path"] or path.startswith("%s/" % module["path"]):
+            return module
+
+
+def import_module_for(path):
+    """Imports the scraper owning path, if any, which registers its routes."""
+    import importlib
+    module = get_module_for(path)
+    if module:
+        return importlib.import_module("xbmctorrent.scrapers.%s" % module["module"])
 
 
 def ungenerate(fn):
@@ -14,3 +46,38 @@ def ungenerate(fn):
     def _fn(*args, **kwargs):
         return list(fn(*args, **kwargs))
     return _fn
+
+
+def html_text(fragment):
+    """Returns the text of an HTML fragment, without its tags and entities."""
+    from HTMLParser import HTMLParser
+    text = HTMLParser().unescape(TAGS_RE.sub("", fragment).decode("utf-8", "replace"))
+    return text.replace(u"\xa0", u" ").strip()
+
+
+def iter_rows(start_re, html_data):
+    """Yields (match, row) for each match of start_re in html_data, row being
+    the markup between the end of the match and the next one."""
+    nodes = list(start_re.finditer(html_data))
+    for i, node in enumerate(nodes):
+        end = i + 1 < len(nodes) and nodes[i + 1].start() or len(html_data)
+        yield node, html_data[node.end():end]
+
+
+def find_magnet(row):
+    """Returns the first magnet link of row, unescaped, if any."""
+    magnet = MAGNET_RE.search(row)
+    return magnet and magnet.group(1).replace("&amp;", "&")
+
+
+def parse_soup_rows(html_data, parse_rows_soup, name, attrs={}):
+    """Returns the rows parse_rows_soup finds in the BeautifulSoup of
+    html_data, for when the pattern scans fail. Only the <name attrs> elements
+    are built, with html.parser. Should that find nothing, the whole page is
+    parsed with html5lib, much slower, but which copes with any markup
+    (its bundled tree builder ignores parse_only)."""
+    from bs4 import BeautifulSoup, SoupStrainer
+    rows = list(parse_rows_soup(BeautifulSoup(html_data, "html.parser", parse_only=SoupStrainer(name, attrs))))
+    if not rows:
+        rows = list(parse_rows_soup(BeautifulSoup(html_data, "html5lib")))
+    return rows
@@ -1,20 +1,20 @@
-from xbmctorrent import plugin
-from xbmctorrent.scrapers import scraper
+from xbmctorrent import plugin, mirrors
 from xbmctorrent.ga import tracked
 from xbmctorrent.caching import cached_route
 from xbmctorrent.utils import ensure_fanart
 from xbmctorrent.library import library_context
+from xbmctorrent.trackers import swarm_health
 
 
-BASE_URL = "%s/" % plugin.get_setting("base_bitsnoop")
+MIRRORS = mirrors.from_setting("base_bitsnoop")
+BASE_URL = "%s/" % MIRRORS[0]
 HEADERS = {
     "Referer": BASE_URL,
 }
-# Cache TTLs
-DEFAULT_TTL = 24 * 3600 # 24 hours
+# Cache TTLs. Top lists change as swarms do, so keep them short.
+DEFAULT_TTL = 3600 # 1 hour
 
 
-@scraper("BitSnoop - Search Engine", "%s/i/logo.png" % BASE_URL)
 @plugin.route("/bitsnoop")
 @ensure_fanart
 @tracked
@@ -23,20 +23,20 @@ def bitsnoop_index():
 
 
 @plugin.route("/bitsnoop/browse/<root>/<page>")
+@swarm_health
+@cached_route(ttl=DEFAULT_TTL)
 @library_context
 @ensure_fanart
 @tracked
 def bitsnoop_page(root, page):
-    from urlparse import urljoin
     from xbmctorrent.scrapers import rss
-    from xbmctorrent.utils import url_get
 
     content_type = plugin.request.args_dict.get("content_type")
     if content_type:
         plugin.set_content(content_type)
 
     page = int(page)
-    page_data = url_get(urljoin(BASE_URL, "%s/%d/" % (root, page)), headers=HEADERS, params={
+    page_data = mirrors.url_get(MIRRORS, "%s/%d/" % (root, page), headers=HEADERS, params={
         "fmt": "rss",
         "sort": "n_s",
         "dir": "desc",
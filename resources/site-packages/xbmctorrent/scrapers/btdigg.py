@@ -1,12 +1,15 @@
-from xbmctorrent import plugin
-from xbmctorrent.scrapers import scraper
+import re
+from xbmctorrent import plugin, mirrors
+from xbmctorrent.scrapers import html_text, iter_rows, find_magnet, parse_soup_rows
 from xbmctorrent.ga import tracked
-from xbmctorrent.caching import cached_route
+from xbmctorrent.caching import cached_route, prefetchable
 from xbmctorrent.utils import ensure_fanart
 from xbmctorrent.library import library_context
+from xbmctorrent.trackers import swarm_health
 
 
-BASE_URL = plugin.get_setting("base_btdigg")
+MIRRORS = mirrors.from_setting("base_btdigg")
+BASE_URL = MIRRORS[0]
 HEADERS = {
     "Referer": BASE_URL,
 }
@@ -15,9 +18,34 @@ SORT_POPULARITY = 1
 SORT_ADDTIME = 2
 SORT_SIZE = 3
 SORT_FILES = 4
+# Cache TTLs. The DHT index changes slowly, but download counts don't, and
+# those are what results are sorted on.
+DEFAULT_TTL = 2 * 3600 # 2 hours
+
+# Result rows are scanned with these instead of building a whole DOM
+NAME_RE = re.compile(r'<td class="torrent_name"[^>]*>\s*<a[^>]*>(.*?)</a>', re.S)
+ATTR_RE = re.compile(r'<span class="attr_val"[^>]*>(.*?)</span>', re.S)
+
+
+def parse_rows(html_data):
+    """Extracts (name, size, downloads, magnet) from a result page, without building a DOM."""
+    for node, row in iter_rows(NAME_RE, html_data):
+        magnet = find_magnet(row)
+        attrs = ATTR_RE.findall(row)
+        if not magnet or len(attrs) < 3:
+            continue
+        yield html_text(node.group(1)), html_text(attrs[0]), html_text(attrs[2]), magnet
+
+
+def parse_rows_soup(soup):
+    """Same as parse_rows, out of the BeautifulSoup of a result page."""
+    name_nodes = soup.findAll("td", "torrent_name")
+    attr_nodes = soup.findAll("table", "torrent_name_tbl")[1::2]
+    for name_node, attr_node in zip(name_nodes, attr_nodes):
+        attrs = attr_node.findAll("span", "attr_val")
+        yield name_node.find("a").text, attrs[0].text.replace(u"\xa0", u" "), attrs[2].text, attr_node.find("a")["href"]
 
 
-@scraper("BTDigg - DHT Search Engine", "%s/logo.png" % BASE_URL)
 @plugin.route("/btdigg")
 @ensure_fanart
 @tracked
@@ -25,34 +53,40 @@ def btdigg_index():
     plugin.redirect(plugin.url_for("btdigg_search"))
 
 
-@plugin.route("/btdigg/search/<query>/<sort>/<page>")
-@library_context
-@ensure_fanart
-@tracked
-def btdigg_page(query, sort, page):
-    from bs4 import BeautifulSoup
-    from xbmctorrent.utils import url_get
-
-    html_data = url_get("%s/search" % BASE_URL, headers=HEADERS, params={
+@prefetchable
+def fetch_rows(query, sort, page):
+    html_data = mirrors.url_get(MIRRORS, "search", headers=HEADERS, params={
         "order": sort,
         "q": query,
         "p": page,
     })
-    soup = BeautifulSoup(html_data, "html5lib")
-    name_nodes = soup.findAll("td", "torrent_name")
-    attr_nodes = soup.findAll("table", "torrent_name_tbl")[1::2]
+    rows = list(parse_rows(html_data or ""))
+    if not rows and "torrent_name" in (html_data or ""):
+        plugin.log.info("BTDigg: fast extraction failed, falling back to BeautifulSoup")
+        rows = parse_soup_rows(html_data, parse_rows_soup, "table", "torrent_name_tbl")
+    return rows
 
-    for name_node, attr_node in zip(name_nodes, attr_nodes):
-        attrs = attr_node.findAll("span", "attr_val")
-        title = "%s (%s, DLs:%s)" % (name_node.find("a").text, attrs[0].text, attrs[2].text)
+
+@plugin.route("/btdigg/search/<query>/<sort>/<page>")
+@swarm_health
+@cached_route(ttl=DEFAULT_TTL)
+@library_context
+@ensure_fanart
+@tracked
+def btdigg_page(query, sort, page):
+    page = int(page)
+    rows = fetch_rows(query, sort, page)
+    for name, size, downloads, magnet in rows:
         yield {
-            "label": title,
-            "path": plugin.url_for("play", uri=attr_node.find("a")["href"]),
+            "label": "%s (%s, DLs:%s)" % (name, size, downloads),
+            "path": plugin.url_for("play", uri=magnet),
             "is_playable": True,
         }
+    if rows:
+        fetch_rows.prefetch(query, sort, page + 1)
     yield {
         "label": ">> Next page",
-        "path": plugin.url_for("btdigg_page", query=query, sort=sort, page=int(page) + 1),
+        "path": plugin.url_for("btdigg_page", query=query, sort=sort, page=page + 1),
         "is_playable": False,
     }
 
@@ -1,16 +1,17 @@
-from xbmctorrent import plugin
-from xbmctorrent.scrapers import scraper
+from xbmctorrent import plugin, mirrors
 from xbmctorrent.ga import tracked
 from xbmctorrent.caching import cached_route
 from xbmctorrent.utils import ensure_fanart
+from xbmctorrent.trackers import swarm_health
 
 
-BASE_URL = "%s/" % plugin.get_setting("base_extratorrent")
+MIRRORS = mirrors.from_setting("base_extratorrent")
+BASE_URL = "%s/" % MIRRORS[0]
 HEADERS = {
     "Referer": BASE_URL,
 }
-# Cache TTLs
-DEFAULT_TTL = 24 * 3600 # 24 hours
+# Cache TTLs. Category pages list recent uploads, so keep them short.
+DEFAULT_TTL = 3600 # 1 hour
 
 MOVIES_CATEGORIES = [
     ("Action", "419"),
@@ -51,7 +52,6 @@ MOVIES_CATEGORIES = [
 ]
 
 
-@scraper("ExtraTorrent - Movies, Series, Anime", "%s/images/logo.gif" % BASE_URL)
 @plugin.route("/extratorrent")
 @ensure_fanart
 @tracked
@@ -72,12 +72,12 @@ def extratorrent_index():
 
 @plugin.route("/extratorrent/search/<search>", name="extratorrent_page_search")
 @plugin.route("/extratorrent/browse/<type_>/<cid>")
+@swarm_health
+@cached_route(ttl=DEFAULT_TTL)
 @ensure_fanart
 @tracked
 def extratorrent_page(type_="", cid="", search="", page=1):
-    from urlparse import urljoin
     from xbmctorrent.scrapers import rss
-    from xbmctorrent.utils import url_get
 
     content_type = plugin.request.args_dict.pop("content_type", None)
     if content_type:
@@ -89,7 +89,7 @@ def extratorrent_page(type_="", cid="", search="", page=1):
         "cid": cid,
     }
     params.update(plugin.request.args_dict)
-    page_data = url_get(urljoin(BASE_URL, "/rss.xml"), headers=HEADERS, params=params)
+    page_data = mirrors.url_get(MIRRORS, "/rss.xml", headers=HEADERS, params=params)
     return rss.parse(page_data, content_type)
 
 
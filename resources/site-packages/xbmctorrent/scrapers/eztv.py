@@ -1,20 +1,19 @@
-from xbmctorrent import plugin
-from xbmctorrent.scrapers import scraper
+from xbmctorrent import plugin, mirrors
 from xbmctorrent.ga import tracked
 from xbmctorrent.caching import cached_route, shelf
 from xbmctorrent.utils import ensure_fanart
 from xbmctorrent.library import library_context
+from xbmctorrent.trackers import swarm_health
 
 
-BASE_URL = "%s/" % plugin.get_setting("base_eztv")
+MIRRORS = mirrors.from_setting("base_eztv")
+BASE_URL = "%s/" % MIRRORS[0]
 HEADERS = {
     "Referer": BASE_URL,
 }
 SHOW_LIST_CACHE_TTL = 24 * 3600 # 24 hours caching
 
 
-# Logo found on http://thesimurg.deviantart.com/art/Logo-for-EZTV-57874544
-@scraper("EZTV - Series", "http://i.imgur.com/XcH6WOg.jpg")
 @plugin.route("/eztv")
 @ensure_fanart
 @tracked
@@ -41,12 +40,12 @@ def eztv_shows_by_letter(letter):
     from itertools import izip, groupby
     from concurrent import futures
     from xbmctorrent.scrapers import ungenerate
-    from xbmctorrent.utils import terminating, url_get, SafeDialogProgress
+    from xbmctorrent.utils import terminating, SafeDialogProgress
     from xbmctorrent import tvdb
 
     with shelf("it.eztv.shows") as eztv_shows:
         if not eztv_shows:
-            showlist = url_get("%s/showlist/" % BASE_URL, headers=HEADERS)
+            showlist = mirrors.url_get(MIRRORS, "showlist/", headers=HEADERS)
             nodes_text = re.findall(r'<a .*?class="thread_link".*?>(.*?)</a.*?>', showlist)
             nodes_href = re.findall(r'<a .*?class="thread_link".*?>', showlist)
             nodes_href = map(lambda x: re.findall(r'href="(.*?)"', x)[0], nodes_href)
@@ -113,6 +112,24 @@ def get_episode_data_from_name(name):
     return 0, 0
 
 
+def get_next_episodes(season_nodes):
+    """Maps the magnet of each episode to the following one, of the same quality if possible."""
+    next_episodes = {}
+    for node_text, node_magnet_link in season_nodes:
+        season, episode = get_episode_data_from_name(node_text)
+        hd = ("720p" in node_text, "1080p" in node_text)
+        following = [(text, link) for text, link in season_nodes if get_episode_data_from_name(text)[1] == episode + 1]
+        following.sort(key=lambda (text, link): ("720p" in text, "1080p" in text) != hd)
+        if following:
+            next_episodes[node_magnet_link] = {
+                "uri": following[0][1],
+                "season": season,
+                "episode": episode + 1,
+                "label": following[0][0],
+            }
+    return next_episodes
+
+
 @plugin.route("/eztv/shows/<show_id>/seasons")
 @ensure_fanart
 @tracked
@@ -121,7 +138,7 @@ def eztv_get_show_seasons(show_id):
     import re
     from itertools import groupby
     from concurrent import futures
-    from xbmctorrent.utils import first, terminating, url_get
+    from xbmctorrent.utils import first, terminating
     from xbmctorrent import tvdb
 
     plugin.set_content("seasons")
@@ -130,7 +147,7 @@ def eztv_get_show_seasons(show_id):
     with futures.ThreadPoolExecutor(max_workers=2) as pool:
         def _eztv_get_show():
             plugin.log.info("Getting show")
-            response = url_get("%s/shows/%s/" % (BASE_URL, show_id), headers=HEADERS)
+            response = mirrors.url_get(MIRRORS, "shows/%s/" % show_id, headers=HEADERS)
             plugin.log.info("Got show")
             return response
         seasons_html = pool.submit(_eztv_get_show)
@@ -164,6 +181,7 @@ def eztv_get_show_seasons(show_id):
 
 
 @plugin.route("/eztv/shows/<show_id>/<season>/episodes")
+@swarm_health
 @library_context
 @ensure_fanart
 @tracked
@@ -173,7 +191,8 @@ def eztv_get_episodes_for_season(show_id, season):
     import re
     from itertools import izip
     from concurrent import futures
-    from xbmctorrent.utils import first, terminating, url_get
+    from xbmctorrent.utils import first, terminating
+    from xbmctorrent.magnet import pack_context_menu, set_next_episodes
     from xbmctorrent import tvdb
 
     plugin.set_content("episodes")
@@ -182,7 +201,7 @@ def eztv_get_episodes_for_season(show_id, season):
     tvdb_id = first(plugin.request.args.get("tvdb_id"))
     with futures.ThreadPoolExecutor(max_workers=2) as pool:
         def _eztv_get_show():
-            return url_get("%s/shows/%s/" % (BASE_URL, show_id), headers=HEADERS)
+            return mirrors.url_get(MIRRORS, "shows/%s/" % show_id, headers=HEADERS)
         shows = pool.submit(_eztv_get_show)
         if tvdb_id:
             tvdb_show = pool.submit(tvdb.get_all_meta, plugin.request.args["tvdb_id"][0])
@@ -196,6 +215,8 @@ def eztv_get_episodes_for_season(show_id, season):
                          href_nodes)
         season_nodes = izip(text_nodes, href_nodes)
         season_nodes = filter(lambda x: get_episode_data_from_name(x[0])[0] == season, season_nodes)
+        if plugin.get_setting("prefetch_next", bool):
+            set_next_episodes(get_next_episodes(season_nodes))
         if tvdb_id:
             tvdb_show = tvdb_show.result()
             fanarts = list([banner for banner in tvdb_show["banners"] if banner["bannertype"] == "fanart"])
@@ -229,9 +250,10 @@ def eztv_get_episodes_for_season(show_id, season):
                 stream_info["width"] = 1920
                 stream_info["height"] = 1080
             item.update({
-                "path": plugin.url_for("play", uri=node_magnet_link),
+                "path": plugin.url_for("play", uri=node_magnet_link, season=season, episode=episode),
                 "stream_info": {"video": stream_info},
                 "is_playable": True,
+                "context_menu": pack_context_menu(node_text, node_magnet_link),
             })
             if fanarts:
                 item.setdefault("properties", {}).update({
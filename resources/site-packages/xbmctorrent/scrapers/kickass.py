@@ -1,11 +1,13 @@
-from xbmctorrent import plugin
-from xbmctorrent.scrapers import scraper
+from xbmctorrent import plugin, mirrors, tmdb
+from xbmctorrent.scrapers import rss
 from xbmctorrent.ga import tracked
-from xbmctorrent.caching import cached_route
+from xbmctorrent.caching import cached_route, prefetchable
 from xbmctorrent.utils import ensure_fanart
+from xbmctorrent.trackers import swarm_health
 
 
-BASE_URL = "%s/" % plugin.get_setting("base_kickass")
+MIRRORS = mirrors.from_setting("base_kickass")
+BASE_URL = "%s/" % MIRRORS[0]
 HEADERS = {
     "Referer": BASE_URL,
 }
@@ -46,15 +48,15 @@ ANIME_GENRES = [
     "Stereotypes", "Super Power", "Swordplay", "Tragedy", "Violence",
 ]
 
-# Cache TTLs
-DEFAULT_TTL = 24 * 3600 # 24 hours
+# Cache TTLs. Browse pages sort on seeders by default, which move by the
+# hour; back navigation only needs minutes.
+DEFAULT_TTL = 3600 # 1 hour
 
 
 def norm_cat(cat):
     return cat.lower().replace(" ", "-")
 
 
-@scraper("Kickass Torrents - Movies, Series, Anime", "%s/content/images/logos/kickasstorrents_500x500.png" % BASE_URL)
 @plugin.route("/kat")
 @ensure_fanart
 @tracked
@@ -134,26 +136,32 @@ def kat_porn():
     ]
 
 
+@prefetchable(warm=tmdb.warm)
+def fetch_items(root, page, sort_field, sort_order):
+    page_data = mirrors.url_get(MIRRORS, "%s/%d" % (root, page), headers=HEADERS, params={
+        "rss": "1",
+        "field": sort_field,
+        "sorder": sort_order
+    })
+    return list(rss.iter_items(page_data))
+
+
 @plugin.route("/kat/browse/<root>/<page>/<sort_field>/<sort_order>")
+@swarm_health
+@cached_route(ttl=DEFAULT_TTL)
 @ensure_fanart
 @tracked
 def kat_page(root, page, sort_field, sort_order):
-    from urlparse import urljoin
-    from xbmctorrent.scrapers import rss
-    from xbmctorrent.utils import url_get
-
     content_type = plugin.request.args_dict.get("content_type")
     if content_type:
         plugin.set_content(content_type)
 
     page = int(page)
-    page_data = url_get(urljoin(BASE_URL, "%s/%d" % (root, page)), headers=HEADERS, params={
-        "rss": "1",
-        "field": sort_field,
-        "sorder": sort_order
-    })
-    for item in rss.parse(page_data, content_type):
+    items = fetch_items(root, page, sort_field, sort_order)
+    for item in rss.render(items, content_type):
         yield item
+    if items:
+        fetch_items.prefetch(root, page + 1, sort_field, sort_order)
     yield {
         "label": ">> Next page",
         "path": plugin.url_for("kat_page", root=root, page=page + 1, sort_field=sort_field, sort_order=sort_order, **plugin.request.args_dict),
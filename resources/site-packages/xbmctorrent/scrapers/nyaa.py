@@ -1,12 +1,14 @@
-from xbmctorrent import plugin
-from xbmctorrent.scrapers import scraper
+from xbmctorrent import plugin, mirrors
+from xbmctorrent.scrapers import rss
 from xbmctorrent.ga import tracked
-from xbmctorrent.caching import cached_route
+from xbmctorrent.caching import cached_route, prefetchable
 from xbmctorrent.utils import ensure_fanart
+from xbmctorrent.trackers import swarm_health
 
 
 # Temporary, will be fixed later by them
-BASE_URL = "%s/" % plugin.get_setting("base_nyaa")
+MIRRORS = mirrors.from_setting("base_nyaa")
+BASE_URL = "%s/" % MIRRORS[0]
 HEADERS = {
     "Referer": BASE_URL,
 }
@@ -41,7 +43,6 @@ SORT_ASCENDING = 2
 DEFAULT_TTL = 2 * 3600 # 2 hours
 
 
-@scraper("NyaaTorrents - Anime", "http://i.imgur.com/P7y2ps2.png")
 @plugin.route("/nyaa")
 @tracked
 def nyaa_index():
@@ -62,23 +63,24 @@ def nyaa_index():
 
 
 @plugin.route("/nyaa/show/<cats>/<offset>/<sort>/<order>")
+@swarm_health
+@cached_route(ttl=DEFAULT_TTL)
 @tracked
 def default_nyaa_page(cats, offset, sort, order):
     return nyaa_page(cats, offset, sort, order)
 
 
 @plugin.route("/nyaa/search/<term>/<offset>/<sort>/<order>")
+@swarm_health
+@cached_route(ttl=DEFAULT_TTL)
 @tracked
 def search_result_page(term, offset, sort, order):
     return nyaa_page("1_0", offset, sort, order, term)
 
 
-def nyaa_page(cats, offset, sort, order, term=""):
-    from xbmctorrent.scrapers import rss
-    from xbmctorrent.utils import url_get
-
-    offset = int(offset)
-    rss_data = url_get(BASE_URL, headers=HEADERS, params={
+@prefetchable
+def fetch_items(cats, offset, sort, order, term):
+    rss_data = mirrors.url_get(MIRRORS, "", headers=HEADERS, params={
         "cats": cats,
         "offset": "%d" % offset,
         "sort": sort,
@@ -86,8 +88,16 @@ def nyaa_page(cats, offset, sort, order, term=""):
         "term": term,
         "page": "rss",
     })
-    for item in rss.parse(rss_data):
+    return list(rss.iter_items(rss_data))
+
+
+def nyaa_page(cats, offset, sort, order, term=""):
+    offset = int(offset)
+    items = fetch_items(cats, offset, sort, order, term)
+    for item in rss.render(items):
         yield item
+    if items:
+        fetch_items.prefetch(cats, offset + 1, sort, order, term)
     yield {
         "label": ">> Next page",
         "path": plugin.url_for(term and "search_result_page" or "default_nyaa_page", cats=cats, sort=sort, order=order, term=term, offset=offset + 1),
@@ -6,6 +6,8 @@ from xbmctorrent.library import library_context
 NSMAP = {
     "torrent": "http://xmlns.ezrss.it/0.1/",
 }
+# Qualified tag names, built once instead of per item
+TORRENT_TAGS = dict((tag, "{%s}%s" % (NSMAP["torrent"], tag)) for tag in ("seeds", "peers", "contentLength", "magnetURI", "fileName"))
 POOL_WORKERS = 4
 
 
@@ -33,96 +35,129 @@ def check_imdb_id(item):
             item["imdb_id"] = match.group(1)
 
 
-@library_context
-def parse(data, content_type=None):
-    import xbmc
+def iter_items(data):
+    """Incrementally parses an RSS feed, yielding a dict per item."""
     import xml.etree.ElementTree as ET
-    from itertools import izip_longest
-    from concurrent import futures
-    from contextlib import nested, closing
-    from xbmctorrent.utils import SafeDialogProgress, get_quality_from_name, get_show_info_from_name, normalize_release_tags
-    from xbmctorrent import tmdb
-
-    root = ET.fromstring(data)
-
-    def _text(node, path):
-        n = node.find(path)
-        if n is not None:
-            return n.text
-    def _attr(node, path, attrib):
-        n = node.find(path)
+    from cStringIO import StringIO
+
+    def _text(nodes, *tags):
+        for tag in tags:
+            n = nodes.get(tag)
+            if n is not None and n.text:
+                return n.text
+    def _attr(nodes, tag, attrib):
+        n = nodes.get(tag)
         if n is not None:
             return n.attrib.get(attrib)
 
-    items = []
-    for node in root.getiterator("item"):
+    for _, node in ET.iterparse(StringIO(data)):
+        if node.tag != "item":
+            continue
+        nodes = {}
+        for child in node.iter():
+            nodes.setdefault(child.tag, child)
         item = {
-            "title": _text(node, "title"),
-            "description": _text(node, "description"),
-            "category": _text(node, "category"),
-            "pub_date": _text(node, "pubDate"),
-            "seeds": _text(node, ".//{%(torrent)s}seeds" % NSMAP) or _text(node, "numSeeders") or _text(node, "seeders"),
-            "peers": _text(node, ".//{%(torrent)s}peers" % NSMAP) or _text(node, "numLeechers") or _text(node, "leechers"),
-            "content_length": _text(node, ".//{%(torrent)s}contentLength" % NSMAP) or _attr(node, ".//enclosure", "length"),
-            "href": _text(node, ".//{%(torrent)s}magnetURI" % NSMAP) or _attr(node, ".//enclosure", "url") or _text(node, "./link"),
-            "filename": _text(node, ".//{%(torrent)s}fileName" % NSMAP),
+            "title": _text(nodes, "title"),
+            "description": _text(nodes, "description"),
+            "category": _text(nodes, "category"),
+            "pub_date": _text(nodes, "pubDate"),
+            "seeds": _text(nodes, TORRENT_TAGS["seeds"], "numSeeders", "seeders"),
+            "peers": _text(nodes, TORRENT_TAGS["peers"], "numLeechers", "leechers"),
+            "content_length": _text(nodes, TORRENT_TAGS["contentLength"]) or _attr(nodes, "enclosure", "length"),
+            "href": _text(nodes, TORRENT_TAGS["magnetURI"]) or _attr(nodes, "enclosure", "url") or _text(nodes, "link"),
+            "filename": _text(nodes, TORRENT_TAGS["fileName"]),
         }
+        node.clear()
         find_image(item)
         check_imdb_id(item)
-        items.append(item)
-
-    tmdb_list = []
-    if content_type:
-        with closing(SafeDialogProgress(delay_close=0)) as dialog:
-            dialog.create(plugin.name)
-            dialog.update(percent=0, line1="Fetching torrent information...", line2="", line3="")
-
-            with futures.ThreadPoolExecutor(max_workers=POOL_WORKERS) as pool:
-                futures = []
-                for item in items:
-                    if item.get("imdb_id"):
-                        futures.append(pool.submit(tmdb.get, item["imdb_id"]))
-                    else:
-                        futures.append(None)
-                state = {"done": 0}
-                def on_item(future):
-                    state["done"] += 1
-                    dialog.update(
-                        percent=int(state["done"] * 100.0 / len(filter(None, futures))),
-                    )
-                [future.add_done_callback(on_item) for future in futures if future]
-                while not all(future.done() for future in futures if future):
-                    if dialog.iscanceled():
-                        return
-                    xbmc.sleep(100)
-        tmdb_list = [future and future.result() or None for future in futures]
-
-    for item, tmdb_data in izip_longest(items, tmdb_list):
-        if tmdb_data:
-            list_item = tmdb.get_list_item(tmdb_data)
-            release_tags = normalize_release_tags(item["title"], list_item["label"])
-            if release_tags:
-                list_item["label"] = "%s (%s)" % (list_item["label"], release_tags)
-        else:
-            list_item = {
-                "label": item["title"],
-                "icon": item.get("img") or "",
-                "thumbnail": item.get("img") or "",
-                "info": {
-                    "genre": item["category"],
-                }
+        yield item
+
+
+def make_list_item(item, tmdb_data=None):
+    from xbmctorrent import tmdb
+    from xbmctorrent.magnet import pack_context_menu
+    from xbmctorrent.utils import get_quality_from_name, normalize_release_tags
+
+    if tmdb_data:
+        list_item = tmdb.get_list_item(tmdb_data)
+        release_tags = normalize_release_tags(item["title"], list_item["label"])
+        if release_tags:
+            list_item["label"] = "%s (%s)" % (list_item["label"], release_tags)
+    else:
+        list_item = {
+            "label": item["title"],
+            "icon": item.get("img") or "",
+            "thumbnail": item.get("img") or "",
+            "info": {
+                "genre": item["category"],
             }
-        list_item.update({
-            "path": plugin.url_for("play", uri=item["href"]),
-            "is_playable": True,
-        })
-        list_item.setdefault("info", {}).update({
-            "genre": "%s (S:%s P:%s)" % (list_item.get("info", {}).get("genre") or "", item["seeds"], item["peers"]),
-        })
-        list_item.setdefault("stream_info", {}).update(get_quality_from_name(item["title"]))
+        }
+    list_item.update({
+        "path": plugin.url_for("play", uri=item["href"]),
+        "is_playable": True,
+        "context_menu": pack_context_menu(item["title"], item["href"]),
+    })
+    list_item.setdefault("info", {}).update({
+        "genre": "%s (S:%s P:%s)" % (list_item.get("info", {}).get("genre") or "", item["seeds"], item["peers"]),
+    })
+    list_item.setdefault("stream_info", {}).update(get_quality_from_name(item["title"]))
+    return list_item
+
+
+def convert_enclosures(items):
+    """Returns items with their .torrent hrefs replaced by the magnets we
+    already converted them to. The others get converted in the background
+    when convert_torrents is on, for next time."""
+    from xbmctorrent.caching import in_background
+    from xbmctorrent.magnet import cached_magnets, from_torrent_urls
+
+    items = list(items)
+    urls = [item["href"] for item in items if item["href"] and item["href"].startswith(("http://", "https://"))]
+    if not urls:
+        return items
+    magnets = cached_magnets(urls)
+    for item in items:
+        item["href"] = magnets.get(item["href"], item["href"])
+    missing = [url for url in urls if url not in magnets]
+    if missing and plugin.get_setting("convert_torrents", bool):
+        in_background(from_torrent_urls, missing)
+    return items
 
-        yield list_item
 
+@library_context
+def render(items, content_type=None):
+    """Yields list items for the given feed items, in order.
+
+    When content_type is set, the TMDB metadata of all items with an IMDB id
+    is fetched at once, and each of them is yielded as soon as its own is in.
+    """
+    from concurrent import futures
+    from contextlib import closing
+    from xbmctorrent.utils import SafeDialogProgress
+    from xbmctorrent import tmdb
+
+    items = convert_enclosures(items)
+    if not content_type:
+        for item in items:
+            yield make_list_item(item)
+        return
+
+    with closing(SafeDialogProgress(delay_close=0)) as dialog:
+        dialog.create(plugin.name)
+        dialog.update(percent=0, line1="Fetching torrent information...", line2="", line3="")
+
+        with futures.ThreadPoolExecutor(max_workers=POOL_WORKERS) as pool:
+            jobs = [item.get("imdb_id") and pool.submit(tmdb.get, item["imdb_id"]) for item in items]
+            for done, (item, job) in enumerate(zip(items, jobs), 1):
+                if dialog.iscanceled():
+                    [job.cancel() for job in jobs if job]
+                    return
+                yield make_list_item(item, job and job.result())
+                dialog.update(percent=int(done * 100.0 / len(items)))
+
+
+def parse(data, content_type=None):
+    return render(iter_items(data), content_type)
 
 
 def get_file_name(href):
@@ -1,14 +1,17 @@
-from xbmctorrent import plugin
-from xbmctorrent.scrapers import scraper
+import re
+from xbmctorrent import plugin, mirrors
+from xbmctorrent.scrapers import html_text, iter_rows, find_magnet, parse_soup_rows
 from xbmctorrent.ga import tracked
-from xbmctorrent.caching import cached_route
+from xbmctorrent.caching import cached_route, prefetchable
 from xbmctorrent.utils import ensure_fanart
 from xbmctorrent.library import library_context
+from xbmctorrent.trackers import swarm_health
 
 
 # Temporary, will be fixed later by them
 IMMUNICITY_TPB_URL = "http://thepiratebay.pe"
-BASE_URL = "%s/" % (plugin.get_setting("immunicity", bool) and IMMUNICITY_TPB_URL or plugin.get_setting("base_tpb"))
+MIRRORS = plugin.get_setting("immunicity", bool) and [IMMUNICITY_TPB_URL] or mirrors.from_setting("base_tpb")
+BASE_URL = "%s/" % MIRRORS[0]
 HEADERS = {
     "Referer": BASE_URL,
 }
@@ -36,11 +39,17 @@ if plugin.get_setting("porn", bool):
         ]),
     ]
 
-# Cache TTLs
-DEFAULT_TTL = 24 * 3600 # 24 hours
+# Cache TTLs. Short: listings sort on upload date and swarm counts, and
+# new torrents come in by the minute. Enough for back navigation.
+DEFAULT_TTL = 30 * 60 # 30 minutes
+
+# Result rows are scanned with these instead of building a whole DOM
+DETNAME_RE = re.compile(r'<div class="detName"[^>]*>\s*<a[^>]*>(.*?)</a>', re.S)
+DETDESC_RE = re.compile(r'<font class="detDesc"[^>]*>(.*?)</font>', re.S)
+CELL_RE = re.compile(r'<td[^>]*>(.*?)</td>', re.S)
+SIZE_RE = re.compile(r"Size (.*?),")
 
 
-@scraper("The Pirate Bay - Movies and Series", "%s/static/img/tpb.jpg" % BASE_URL)
 @plugin.route("/tpb")
 @ensure_fanart
 @tracked
@@ -61,32 +70,56 @@ def piratebay_index():
         yield cat
 
 
+def parse_rows(html_data):
+    """Extracts (name, size, seeds, peers, magnet) from a result page, without building a DOM."""
+    for node, row in iter_rows(DETNAME_RE, html_data):
+        magnet = find_magnet(row)
+        desc = DETDESC_RE.search(row)
+        cells = desc and CELL_RE.findall(row[desc.end():])
+        if not magnet or len(cells or []) < 2:
+            continue
+        seeds, peers = cells[:2]
+        size = SIZE_RE.search(html_text(desc.group(1)))
+        yield html_text(node.group(1)), size and size.group(1) or "", html_text(seeds), html_text(peers), magnet
+
+
+def parse_rows_soup(soup):
+    """Same as parse_rows, out of the BeautifulSoup of a result page."""
+    for node in soup.findAll("div", "detName"):
+        seeds, peers = map(lambda x: x.text, node.parent.parent.findAll("td")[2:])
+        magnet_node = node.parent.findAll("a")[1]
+        desc_node = node.parent.findAll("font", "detDesc")[0]
+        size = SIZE_RE.search(desc_node.text).group(1).replace(u"\xa0", u" ")
+        yield node.a.text, size, seeds, peers, magnet_node["href"]
+
+
+@prefetchable
+def fetch_rows(root, page):
+    html_data = mirrors.url_get(MIRRORS, "%s/%d/7/100,200,500" % (root, page), headers=HEADERS)
+    rows = list(parse_rows(html_data or ""))
+    if not rows and "detName" in (html_data or ""):
+        plugin.log.info("TPB: fast extraction failed, falling back to BeautifulSoup")
+        rows = parse_soup_rows(html_data, parse_rows_soup, "table", {"id": "searchResult"})
+    return rows
+
+
 @plugin.route("/tpb/<root>/<page>")
+@swarm_health
+@cached_route(ttl=DEFAULT_TTL)
 @library_context
 @ensure_fanart
 @tracked
 def piratebay_page(root, page):
-    import re
-    from bs4 import BeautifulSoup
-    from urlparse import urljoin
-    from xbmctorrent.utils import url_get
-
     page = int(page)
-    html_data = url_get(urljoin(BASE_URL, "%s/%d/7/100,200,500" % (root, page)), headers=HEADERS)
-    soup = BeautifulSoup(html_data, "html5lib")
-    nodes = soup.findAll("div", "detName")
-
-    for node in nodes:
-        seeds, peers = map(lambda x: x.text, node.parent.parent.findAll("td")[2:])
-        magnet_node = node.parent.findAll("a")[1]
-        desc_node = node.parent.findAll("font", "detDesc")[0]
-        size = re.search("Size (.*?),", desc_node.text).group(1)
-        text = "%s (%s S:%s P:%s)" % (node.a.text, size.replace("&nbsp;", " "), seeds, peers)
+    rows = fetch_rows(root, page)
+    for name, size, seeds, peers, magnet in rows:
         yield {
-            "label": text,
-            "path": plugin.url_for("play", uri=magnet_node["href"]),
+            "label": "%s (%s S:%s P:%s)" % (name, size, seeds, peers),
+            "path": plugin.url_for("play", uri=magnet),
             "is_playable": True,
         }
+    if rows:
+        fetch_rows.prefetch(root, page + 1)
     yield {
         "label": ">> Next page",
         "path": plugin.url_for("piratebay_page", root=root, page=page + 1),
@@ -1,12 +1,12 @@
-from xbmctorrent import plugin
-from xbmctorrent.scrapers import scraper
+from xbmctorrent import plugin, mirrors, tmdb
 from xbmctorrent.ga import tracked
-from xbmctorrent.caching import cached_route
+from xbmctorrent.caching import cached_route, prefetchable
 from xbmctorrent.utils import ensure_fanart
 from xbmctorrent.library import library_context
 
 
-BASE_URL = "%s/" % plugin.get_setting("base_yify")
+MIRRORS = mirrors.from_setting("base_yify")
+BASE_URL = "%s/" % MIRRORS[0]
 HEADERS = {
     "Referer": BASE_URL,
 }
@@ -44,7 +44,6 @@ GENRES = [
 DEFAULT_TTL = 24 * 3600 # 24 hours
 
 
-@scraper("YIFY Torrents - Movies", "http://fbcdn-sphotos-h-a.akamaihd.net/hphotos-ak-frc3/204323_207963335901313_5804989_o.jpg")
 @plugin.route("/yify")
 @ensure_fanart
 @tracked
@@ -70,6 +69,11 @@ def yify_index():
     ]
 
 
+@prefetchable(warm=lambda search_result: tmdb.warm(search_result.get("MovieList") or [], "ImdbCode"))
+def fetch_movies(**params):
+    return mirrors.url_get_json(MIRRORS, "api/list.json", params=params, headers=HEADERS)
+
+
 @library_context
 def yify_show_data(callback):
     import xbmc
@@ -77,8 +81,7 @@ def yify_show_data(callback):
     from contextlib import nested, closing
     from itertools import izip, chain
     from concurrent import futures
-    from xbmctorrent import tmdb
-    from xbmctorrent.utils import url_get_json, terminating, SafeDialogProgress
+    from xbmctorrent.utils import terminating, SafeDialogProgress
 
     plugin.set_content("movies")
     args = dict((k, v[0]) for k, v in plugin.request.args.items())
@@ -91,7 +94,7 @@ def yify_show_data(callback):
         dialog.update(percent=0, line1="Fetching movie information...", line2="", line3="")
 
         try:
-            search_result = url_get_json("%s/api/list.json" % BASE_URL, params=args, headers=HEADERS)
+            search_result = fetch_movies(**args)
         except:
             plugin.notify("Unable to connect to %s." % BASE_URL)
             raise
@@ -152,7 +155,8 @@ def yify_show_data(callback):
 
         if current_page < (int(search_result["MovieCount"]) / limit):
             next_args = args.copy()
-            next_args["set"] = int(next_args["set"]) + 1
+            next_args["set"] = "%d" % (current_page + 1)
+            fetch_movies.prefetch(**next_args)
             yield {
                 "label": ">> Next page",
                 "path": plugin.url_for(callback, **next_args),
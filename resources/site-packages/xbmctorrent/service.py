@@ -0,0 +1,96 @@
+import os
+import json
+import socket
+import xbmc
+from xbmctorrent import plugin
+
+
+# Keep in sync with addon.py, which can't import us without losing the point.
+PORT_FILE = xbmc.translatePath("special://profile/addon_data/%s/service.port" % plugin.id)
+ACCEPT_TIMEOUT = 1
+CLIENT_TIMEOUT = 5 * 60
+
+
+def serve():
+    """Serves the scraper listings to addon.py over a local socket, so that
+    clicks don't pay for the imports, settings and caches again."""
+    if not plugin.get_setting("service", bool):
+        return
+
+    # Any local user can connect, so requests must carry the token of this
+    # session, which only we and addon.py can read from PORT_FILE.
+    token = os.urandom(16).encode("hex")
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", 0))
+    server.listen(5)
+    server.settimeout(ACCEPT_TIMEOUT)
+    if os.path.exists(PORT_FILE):
+        os.remove(PORT_FILE)
+    with os.fdopen(os.open(PORT_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600), "w") as fp:
+        fp.write("%d %s" % (server.getsockname()[1], token))
+    plugin.log.info("Service listening on port %d" % server.getsockname()[1])
+
+    try:
+        while not xbmc.abortRequested:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            try:
+                conn.settimeout(CLIENT_TIMEOUT)
+                handle_client(conn, token)
+            except Exception:
+                import traceback
+                map(plugin.log.error, traceback.format_exc().split("\n"))
+            finally:
+                conn.close()
+    finally:
+        server.close()
+        os.remove(PORT_FILE)
+
+
+def handle_client(conn, token):
+    """Reads one request line, and sends back the listing as JSON lines:
+    item, content, sort_method, then finish. Items go out as the view
+    yields them, which for cached or sorted views (cached_route,
+    swarm_health...) is once the whole list is built. Sends fallback for
+    the routes which must run in addon.py (playback, RunPlugin...)."""
+    from xbmcswift2 import Request
+    from xbmctorrent.scrapers import get_module_for
+
+    reader = conn.makefile("rb")
+    writer = conn.makefile("wb")
+    def send(**message):
+        writer.write("%s\n" % json.dumps(message))
+        writer.flush()
+
+    request = json.loads(reader.readline())
+    if request.get("token") != token:
+        plugin.log.error("Service: rejected a request without the session token")
+        return
+    plugin._request = Request(request["url"], int(request["handle"]))
+    if plugin.request.handle < 0 or not get_module_for(plugin.request.path):
+        send(fallback=True)
+        return
+
+    def finish(items=None, sort_methods=None, **kwargs):
+        for item in items or []:
+            send(item=item)
+        plugin._end_of_directory = True
+        send(finish=dict(kwargs, sort_methods=sort_methods))
+
+    plugin._end_of_directory = False
+    plugin.finish = finish
+    plugin.set_content = lambda content: send(content=content)
+    plugin.add_sort_method = lambda *args: send(sort_method=args)
+    try:
+        plugin._dispatch(plugin.request.path)
+    except Exception:
+        import traceback
+        send(error=traceback.format_exc())
+        raise
+    finally:
+        del plugin.finish, plugin.set_content, plugin.add_sort_method
+        for storage in getattr(plugin, "_unsynced_storages", {}).values():
+            storage.sync()
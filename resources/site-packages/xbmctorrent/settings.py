@@ -0,0 +1,67 @@
+import os
+import time
+import threading
+import xbmc
+
+
+CHECK_INTERVAL = 2 # Look for changes on disk at most every 2 seconds
+
+
+def read_settings(filename, attribute):
+    """Returns the id -> attribute mapping of the <setting> nodes of filename."""
+    from xml.etree import cElementTree as ElementTree
+    settings = {}
+    for node in ElementTree.parse(filename).getiterator("setting"):
+        if node.get("id"):
+            value = node.get(attribute)
+            if value is None and attribute == "value":
+                value = node.text or "" # Newer settings.xml format
+            if value is not None:
+                settings[node.get("id")] = value.encode("utf-8")
+    return settings
+
+
+class SettingsSnapshot(object):
+    """Wraps an xbmcaddon.Addon, and answers getSetting from the settings XML
+    files, loaded once and reloaded only when the user settings change,
+    instead of calling into XBMC every time."""
+
+    def __init__(self, addon):
+        self._addon = addon
+        self._lock = threading.Lock()
+        self._defaults = read_settings(os.path.join(addon.getAddonInfo("path"), "resources", "settings.xml"), "default")
+        self._filename = os.path.join(xbmc.translatePath(addon.getAddonInfo("profile")), "settings.xml")
+        self._mtime = None
+        self._checked_at = 0
+        self._settings = {}
+
+    def __getattr__(self, name):
+        return getattr(self._addon, name)
+
+    def _refresh(self):
+        now = time.time()
+        if now - self._checked_at < CHECK_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self._filename)
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                self._mtime = mtime
+                settings = dict(self._defaults)
+                if mtime is not None:
+                    settings.update(read_settings(self._filename, "value"))
+                self._settings = settings
+
+    def getSetting(self, id):
+        self._refresh()
+        try:
+            return self._settings[id]
+        except KeyError:
+            return self._addon.getSetting(id)
+
+    def setSetting(self, id, value):
+        self._addon.setSetting(id, value)
+        self._settings[id] = isinstance(value, unicode) and value.encode("utf-8") or value
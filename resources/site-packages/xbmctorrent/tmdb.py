@@ -6,6 +6,7 @@ BASE_URL = "http://api.themoviedb.org/3"
 HEADERS = {
     "Referer": BASE_URL,
 }
+WARM_WORKERS = 4
 
 
 @memoize
@@ -31,6 +32,15 @@ def get(imdb_id):
         return dict(movie)
 
 
+def warm(items, key="imdb_id"):
+    """Fetches the TMDB metadata of items, by the IMDB id at item[key], ahead
+    of time, so it's cached when they are rendered."""
+    from concurrent import futures
+
+    with futures.ThreadPoolExecutor(max_workers=WARM_WORKERS) as pool:
+        [pool.submit(get, item[key]) for item in items if item.get(key)]
+
+
 def search(query, **kwargs):
     from xbmctorrent.utils import url_get_json
 
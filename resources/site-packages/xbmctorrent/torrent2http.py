@@ -1,6 +1,7 @@
 import os
 import sys
 import stat
+import time
 import subprocess
 import xbmcaddon
 from xbmctorrent.common import RESOURCES_PATH
@@ -16,6 +17,48 @@ ANDROID_XBMC_IDS = [
     "hk.minix.xbmc",                        # Minix XBMC
     plugin.get_setting("android_app_id"),   # Whatever the user sets
 ]
+CLIENT_TIMEOUT = 10
+START_TIMEOUT = 20
+START_ATTEMPTS = 3
+READY_MIN_DELAY = 0.01
+READY_MAX_DELAY = 0.25
+WARM_IDLE_TIMEOUT = 5 * 60 # torrent2http exits after 5 minutes without requests
+MAX_RESUME_FILES = 100
+
+
+class Client(object):
+    """Calls the torrent2http JSON API (status, ls...) over a single keep-alive
+    connection, instead of opening a new one for every poll."""
+
+    def __init__(self, bind_address):
+        self.bind_address = bind_address
+        self._conn = None
+
+    def __call__(self, cmd):
+        import json
+        import httplib
+        import socket
+        for retry in (False, True):
+            if self._conn is None:
+                self._conn = httplib.HTTPConnection(self.bind_address, timeout=CLIENT_TIMEOUT)
+            try:
+                self._conn.request("GET", "/%s" % cmd)
+                response = self._conn.getresponse()
+                data = response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                # torrent2http may have closed an idle connection, try a fresh one once
+                self.close()
+                if retry:
+                    raise
+        if response.status != 200:
+            raise httplib.HTTPException("torrent2http returned %d for /%s" % (response.status, cmd))
+        return json.loads(data)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
 
 
 def ensure_exec_perms(file_):
@@ -68,24 +111,12 @@ def find_free_port():
     return port
 
 
-def start(**kwargs):
-    torrent2http_dir, torrent2http_bin = get_torrent2http_binary()
-    args = [torrent2http_bin]
-    bind_port = find_free_port()
-    kwargs["bind"] = ":%d" % bind_port
-
-    for k, v in kwargs.items():
-        args.append("--%s" % k)
-        if v:
-            args.append(v)
-
+def popen_kwargs(torrent2http_dir):
     # Needed because torrent2http is vendored with Boost and libtorrent-rasterbar
     env = os.environ.copy()
     env["LD_LIBRARY_PATH"] = torrent2http_dir
     env["DYLD_LIBRARY_PATH"] = torrent2http_dir
 
-    import xbmc
-    xbmc.log(repr(args))
     kwargs = {
         "cwd": torrent2http_dir,
         "env": env,
@@ -95,16 +126,182 @@ def start(**kwargs):
         si.dwFlags |= 1
         si.wShowWindow = 0
         kwargs["startupinfo"] = si
-    proc = subprocess.Popen(args, **kwargs)
-    proc.bind_address = "localhost:%d" % bind_port
-    def proc_close():
-        if not proc.poll():
-            plugin.log.info("Trying to stop torrent2http at http://%s/shutdown" % proc.bind_address)
+    return kwargs
+
+
+def get_supported_options(torrent2http_dir, torrent2http_bin):
+    """Returns the options the torrent2http binary knows, from its --help.
+    Cached until the binary changes."""
+    import re
+    from xbmctorrent.caching import shelf
+    st = os.stat(torrent2http_bin)
+    version = "%s:%d:%d" % (torrent2http_bin, st.st_size, st.st_mtime)
+    with shelf("xbmctorrent.torrent2http.options") as options:
+        if options.get("version") != version:
             try:
-                url_get("http://%s/shutdown" % proc.bind_address, with_immunicity=False)
-            except Exception, e:
-                plugin.log.info('Failed to sto torrent2http')
-                map(plugin.log.info, traceback.format_exc(e).split('\n'))
+                proc = subprocess.Popen([torrent2http_bin, "--help"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **popen_kwargs(torrent2http_dir))
+                usage = proc.communicate()[0]
+            except OSError:
+                usage = ""
+            options["version"] = version
+            options["options"] = set(re.findall(r"(?m)^\s*--?([a-zA-Z][\w-]*)", usage))
+            plugin.log.info("torrent2http supports %s" % ", ".join(sorted(options["options"])))
+        return options["options"]
+
+
+def find_option(supported, *names):
+    for name in names:
+        if name in supported:
+            return name
+
+
+def get_option(*names):
+    """Returns the first of names the torrent2http binary supports, if any."""
+    return find_option(get_supported_options(*get_torrent2http_binary()), *names)
+
+
+def get_resume_file(digest):
+    """Returns where torrent2http saves the fast resume data of the torrent
+    with (hex) info-hash digest, forgetting the least recently used ones."""
+    from xbmctorrent.caching import CACHE_DIR
+    resume_dir = os.path.join(CACHE_DIR, "resume")
+    if not os.path.exists(resume_dir):
+        os.makedirs(resume_dir)
+    path = os.path.join(resume_dir, "%s.fastresume" % digest)
+    if os.path.exists(path):
+        os.utime(path, None)
+
+    resume_files = [os.path.join(resume_dir, f) for f in os.listdir(resume_dir) if f != os.path.basename(path)]
+    for old_path in sorted(resume_files, key=os.path.getmtime)[:-(MAX_RESUME_FILES - 1)]:
+        os.remove(old_path)
+    return path
+
+
+def shutdown(bind_address):
+    import traceback
+    plugin.log.info("Trying to stop torrent2http at http://%s/shutdown" % bind_address)
+    try:
+        url_get("http://%s/shutdown" % bind_address, with_immunicity=False)
+    except Exception, e:
+        plugin.log.info("Failed to stop torrent2http")
+        map(plugin.log.info, traceback.format_exc(e).split("\n"))
+
+
+def wait_ready(proc, deadline):
+    """Waits for torrent2http to accept connections, trying to connect with an
+    exponential backoff. Returns False as soon as it exits, or at deadline."""
+    import socket
+    host, port = proc.bind_address.split(":")
+    delay = READY_MIN_DELAY
+    while proc.poll() is None:
+        try:
+            socket.create_connection((host, int(port)), READY_MAX_DELAY).close()
+            return True
+        except socket.error:
+            pass
+        if time.time() + delay > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, READY_MAX_DELAY)
+    plugin.log.info("torrent2http exited with code %d" % proc.returncode)
+    return False
+
+
+class WarmProcess(object):
+    """A torrent2http left running by a previous playback, that we adopt."""
+
+    def __init__(self, bind_address):
+        self.bind_address = bind_address
+        self.returncode = None
+        self.ready = True
+
+    def poll(self):
+        return self.returncode
+
+
+def adopt_warm_process(key):
+    """Returns the torrent2http kept warm for the same options, if still alive.
+    Stops it if it was started for something else."""
+    from xbmctorrent.caching import shelf
+    with shelf("xbmctorrent.torrent2http.sessions") as sessions:
+        warm = sessions.pop("warm", None)
+    if not warm:
+        return
+    if warm["key"] != key:
+        shutdown(warm["bind_address"])
+        return
+    proc = WarmProcess(warm["bind_address"])
+    try:
+        Client(proc.bind_address)("status")
+    except Exception:
+        return
+    plugin.log.info("Reusing torrent2http at %s" % proc.bind_address)
+    return proc
+
+
+def warm_key(kwargs):
+    """Identifies what a torrent2http process was started for: the info-hash
+    of its torrent and its other options. Magnet trackers are left out, they
+    change with the tracker ranking."""
+    from xbmctorrent.magnet import info_hash
+    uri = kwargs.get("uri")
+    options = sorted((k, v) for k, v in kwargs.items() if k != "uri")
+    return repr((info_hash(uri or "") or uri, options))
+
+
+def start(**kwargs):
+    torrent2http_dir, torrent2http_bin = get_torrent2http_binary()
+    supported = get_supported_options(torrent2http_dir, torrent2http_bin)
+    key = warm_key(kwargs)
+
+    # When torrent2http can exit on its own once idle, leave it running after
+    # playback, to play the same torrent again with DHT and peers warm.
+    max_idle = find_option(supported, "max-idle", "max_idle")
+    state_file = find_option(supported, "state-file", "state_file")
+    proc = max_idle and adopt_warm_process(key)
+    if not proc:
+        from xbmctorrent.caching import CACHE_DIR
+        if max_idle:
+            kwargs[max_idle] = str(WARM_IDLE_TIMEOUT)
+        if state_file:
+            kwargs[state_file] = os.path.join(CACHE_DIR, "torrent2http.state")
+
+        deadline = time.time() + START_TIMEOUT
+        for attempt in range(START_ATTEMPTS):
+            args = [torrent2http_bin]
+            # Someone may take the port before torrent2http does, in which case it
+            # exits right away and we try again with another one.
+            bind_port = find_free_port()
+            kwargs["bind"] = ":%d" % bind_port
+
+            for k, v in kwargs.items():
+                args.append("--%s" % k)
+                if v:
+                    args.append(v)
+
+            import xbmc
+            xbmc.log(repr(args))
+            proc = subprocess.Popen(args, **popen_kwargs(torrent2http_dir))
+            proc.bind_address = "localhost:%d" % bind_port
+            proc.ready = wait_ready(proc, deadline)
+            if proc.ready or proc.poll() is None:
+                break
+
+    proc.client = Client(proc.bind_address)
+    proc.keep_warm = bool(max_idle)
+    def proc_close():
+        proc.client.close()
+        if proc.poll() is None:
+            if not proc.ready:
+                plugin.log.info("torrent2http never got ready, killing it")
+                proc.kill()
+            elif proc.keep_warm:
+                from xbmctorrent.caching import shelf
+                plugin.log.info("Leaving torrent2http at %s warm" % proc.bind_address)
+                with shelf("xbmctorrent.torrent2http.sessions") as sessions:
+                    sessions["warm"] = {"key": key, "bind_address": proc.bind_address}
+            else:
+                shutdown(proc.bind_address)
 
     proc.close = proc_close
     return proc
@@ -0,0 +1,251 @@
+import time
+import threading
+from xbmctorrent import plugin
+from xbmctorrent.caching import shelf
+
+
+TOP_TRACKERS = 5
+PROBE_TIMEOUT = 3
+PROBE_TTL = 6 * 3600 # Check trackers again after 6 hours
+PROBE_WORKERS = 10
+UDP_PROTOCOL_ID = 0x41727101980
+UDP_ACTION_CONNECT = 0
+UDP_ACTION_SCRAPE = 2
+UDP_ACTION_ERROR = 3
+UDP_MAX_SCRAPE = 74 # info-hashes per scrape packet, so that it fits in a single UDP packet
+SCRAPE_TTL = 10 * 60
+SCRAPE_MAX_TRACKERS = 8
+SCRAPE_TIMEOUT = 3 # For all the trackers of a listing, whatever their number of chunks
+
+_probing = threading.Lock()
+
+
+def get_candidates():
+    """Returns the public trackers, followed by the ones from the extra_trackers setting."""
+    from xbmctorrent.magnet import PUBLIC_TRACKERS
+    extra = plugin.get_setting("extra_trackers").replace(",", " ").split()
+    return PUBLIC_TRACKERS + [tracker for tracker in extra if tracker not in PUBLIC_TRACKERS]
+
+
+def _udp_request(sock, address, connection_id, action, payload="", deadline=None):
+    """Sends a UDP tracker request, and returns the payload of its answer.
+    Raises socket.timeout if it's not in by deadline, if any."""
+    import os
+    import socket
+    import struct
+    transaction_id = struct.unpack(">I", os.urandom(4))[0]
+    sock.sendto(struct.pack(">QII", connection_id, action, transaction_id) + payload, address)
+    while True:
+        if deadline:
+            if time.time() >= deadline:
+                raise socket.timeout("timed out")
+            sock.settimeout(deadline - time.time())
+        data = sock.recv(2048)
+        if len(data) < 8:
+            continue
+        answer_action, answer_transaction_id = struct.unpack(">II", data[:8])
+        if answer_transaction_id != transaction_id:
+            continue
+        if answer_action == UDP_ACTION_ERROR:
+            raise socket.error(data[8:])
+        if answer_action == action:
+            return data[8:]
+
+
+def _udp_connect(sock, address, deadline=None):
+    import struct
+    return struct.unpack(">Q", _udp_request(sock, address, UDP_PROTOCOL_ID, UDP_ACTION_CONNECT, deadline=deadline)[:8])[0]
+
+
+def probe_udp(host, port, timeout=PROBE_TIMEOUT):
+    """Sends a UDP tracker connect request (BEP 15), and returns how long it
+    took to get the answer. Raises socket.error on timeout."""
+    import socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.settimeout(timeout)
+        start = time.time()
+        _udp_connect(sock, (host, port))
+        return time.time() - start
+    finally:
+        sock.close()
+
+
+def scrape_udp(host, port, digests, timeout=PROBE_TIMEOUT):
+    """Scrapes the swarms of the (hex) info-hashes digests off a UDP tracker
+    (BEP 15), UDP_MAX_SCRAPE at a time, within timeout seconds in all.
+    Returns digest -> (seeds, peers)."""
+    import socket
+    import struct
+    deadline = time.time() + timeout
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        address = (host, port)
+        connection_id = _udp_connect(sock, address, deadline)
+        swarms = {}
+        for i in range(0, len(digests), UDP_MAX_SCRAPE):
+            chunk = digests[i:i + UDP_MAX_SCRAPE]
+            data = _udp_request(sock, address, connection_id, UDP_ACTION_SCRAPE, "".join(digest.decode("hex") for digest in chunk), deadline)
+            for j, digest in enumerate(chunk[:len(data) / 12]):
+                seeds, completed, peers = struct.unpack(">III", data[j * 12:(j + 1) * 12])
+                swarms[digest] = (seeds, peers)
+        return swarms
+    finally:
+        sock.close()
+
+
+def probe_http(url, timeout=PROBE_TIMEOUT):
+    """Returns how long it took the HTTP tracker to answer at all, errors included."""
+    import httplib
+    import urlparse
+    parsed = urlparse.urlparse(url)
+    conn_class = parsed.scheme == "https" and httplib.HTTPSConnection or httplib.HTTPConnection
+    conn = conn_class(parsed.netloc, timeout=timeout)
+    try:
+        start = time.time()
+        conn.request("GET", parsed.path or "/")
+        conn.getresponse().read()
+        return time.time() - start
+    finally:
+        conn.close()
+
+
+def probe(tracker):
+    """Returns the latency of tracker, None if it's down."""
+    import urlparse
+    parsed = urlparse.urlparse(tracker)
+    try:
+        if parsed.scheme == "udp":
+            return probe_udp(parsed.hostname, parsed.port or 80)
+        if parsed.scheme in ("http", "https"):
+            return probe_http(tracker)
+    except Exception, e:
+        plugin.log.info("Tracker %s is down: %s" % (tracker, e))
+
+
+def probe_and_record(tracker):
+    latency = probe(tracker)
+    with shelf("xbmctorrent.trackers") as health:
+        health[tracker] = {"latency": latency, "checked_at": time.time()}
+    return latency
+
+
+def probe_all(trackers):
+    """Probes trackers in parallel, recording each result as soon as it's in,
+    since background probes may not live to see the others."""
+    from concurrent import futures
+    with futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        return list(pool.map(probe_and_record, trackers))
+
+
+def get_best_trackers(count=TOP_TRACKERS):
+    """Returns the count fastest trackers which answered, followed by those
+    we don't know about yet, dead ones left out. Trackers with stale
+    results are probed in the background, for next time."""
+    candidates = get_candidates()
+    now = time.time()
+    with shelf("xbmctorrent.trackers") as health:
+        stats = dict((tracker, health.get(tracker)) for tracker in candidates)
+    stale = [tracker for tracker in candidates if not stats[tracker] or (now - stats[tracker]["checked_at"]) > PROBE_TTL]
+    if stale:
+        from xbmctorrent.utils import run_in_background
+        run_in_background(_probing, probe_all, stale)
+
+    def _key(entry):
+        index, tracker = entry
+        if stats[tracker]:
+            return (0, stats[tracker]["latency"], index)
+        return (1, 0, index)
+    ranked = sorted(enumerate(candidates), key=_key)
+    return [tracker for index, tracker in ranked if not stats[tracker] or stats[tracker]["latency"] is not None][:count]
+
+
+def get_health_table():
+    """Returns (tracker, stats) for all candidate trackers, stats being None if never probed."""
+    with shelf("xbmctorrent.trackers") as health:
+        return [(tracker, health.get(tracker) and dict(health[tracker])) for tracker in get_candidates()]
+
+
+def _scrape(tracker, digests, timeout=SCRAPE_TIMEOUT):
+    import urlparse
+    parsed = urlparse.urlparse(tracker)
+    try:
+        return scrape_udp(parsed.hostname, parsed.port or 80, digests, timeout)
+    except Exception, e:
+        plugin.log.info("Could not scrape %s: %s" % (tracker, e))
+        return {}
+
+
+def get_swarms(torrents):
+    """Returns digest -> (seeds, peers) for torrents, a list of (digest,
+    trackers), asking each UDP tracker about all its torrents at once.
+    Swarms are cached for SCRAPE_TTL."""
+    import urlparse
+    from concurrent import futures
+
+    now = time.time()
+    with shelf("xbmctorrent.swarms") as cache:
+        swarms = dict((digest, cache[digest]["swarm"]) for digest, trackers in torrents
+                      if digest in cache and (now - cache[digest]["scraped_at"]) < SCRAPE_TTL)
+
+    # Every torrent is asked to the best trackers, and to its own
+    best = get_best_trackers()
+    by_tracker = {}
+    for digest, trackers in torrents:
+        if digest not in swarms:
+            for tracker in best + trackers:
+                if urlparse.urlparse(tracker).scheme == "udp":
+                    by_tracker.setdefault(tracker, set()).add(digest)
+    if not by_tracker:
+        return swarms
+    trackers = sorted(by_tracker, key=lambda tracker: len(by_tracker[tracker]), reverse=True)[:SCRAPE_MAX_TRACKERS]
+
+    # All trackers are scraped at once, each within SCRAPE_TIMEOUT in all
+    with futures.ThreadPoolExecutor(max_workers=len(trackers)) as pool:
+        results = list(pool.map(lambda tracker: _scrape(tracker, sorted(by_tracker[tracker])), trackers))
+    scraped = {}
+    for result in results:
+        for digest, swarm in result.items():
+            # Trackers only know about their own peers, the biggest swarm is the closest
+            if swarm[0] >= scraped.get(digest, (-1, -1))[0]:
+                scraped[digest] = swarm
+    with shelf("xbmctorrent.swarms") as cache:
+        for digest, swarm in scraped.items():
+            cache[digest] = {"swarm": swarm, "scraped_at": now}
+    swarms.update(scraped)
+    return swarms
+
+
+def swarm_health(fn):
+    """Appends the live seeds and peers of playable items, scraped from the
+    trackers, to their labels, and sorts them by seeds if asked to.
+    Only when the swarm_health setting is on."""
+    from functools import wraps
+    @wraps(fn)
+    def _fn(*a, **kwds):
+        import urllib
+        import urlparse
+        from xbmctorrent.magnet import info_hash
+        items = fn(*a, **kwds)
+        if items is None or not plugin.get_setting("swarm_health", bool):
+            return items
+        items = list(items)
+        torrents = {}
+        for item in items:
+            if item.get("is_playable"):
+                # Playable items are /play/<uri> routes
+                uri = urllib.unquote(urlparse.urlparse(item["path"]).path.split("/play/", 1)[-1])
+                digest = info_hash(uri)
+                if digest:
+                    torrents[id(item)] = (digest, urlparse.parse_qs(uri.replace("magnet:?", "")).get("tr", []))
+        swarms = get_swarms(torrents.values())
+        seeds = {}
+        for item in items:
+            swarm = id(item) in torrents and swarms.get(torrents[id(item)][0])
+            if swarm:
+                item["label"] = "%s [S:%d P:%d]" % (item["label"], swarm[0], swarm[1])
+                seeds[id(item)] = swarm[0]
+        if plugin.get_setting("swarm_health_sort", bool):
+            items.sort(key=lambda item: (not item.get("is_playable"), -seeds.get(id(item), 0)))
+        return items
+    return _fn
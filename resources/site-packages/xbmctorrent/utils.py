@@ -64,6 +64,23 @@ def terminating(thing, timeout=5):
         thing.join()
 
 
+def run_in_background(lock, fn, *args):
+    """Runs fn(*args) in a daemon thread holding lock, unless lock is already
+    held: background refreshes don't need to pile up. fn should save its
+    results as they come, since the thread may not outlive the plugin."""
+    import threading
+    if not lock.acquire(False):
+        return
+    def _run():
+        try:
+            fn(*args)
+        finally:
+            lock.release()
+    thread = threading.Thread(target=_run)
+    thread.daemon = True
+    thread.start()
+
+
 def get_show_info_from_name(name):
     import re
     # for r in (r"([\w\s\.\-]+)[\s\.]+S(\d+)E(\d+).*-(\w+)", r"([\w\s\.\-]+)[\s\.]+(\d+)x(\d+).*-(\w+)"):
@@ -87,6 +104,16 @@ def get_show_info_from_name(name):
         }
 
 
+def get_season_pack_from_name(name):
+    """Returns the season of a season pack release, None if name isn't one."""
+    import re
+    if get_show_info_from_name(name):
+        return None
+    season_result = re.search(r"(?i)\b(?:S|Season[\s\.]*)(\d+)\b", name)
+    if season_result:
+        return int(season_result.group(1))
+
+
 def get_quality_from_name(name):
     name = name.lower()
     video = {}
@@ -130,7 +157,8 @@ def normalize_release_tags(name, real_title):
     return release_tags.strip()
 
 
-def url_get(url, params={}, headers={}, with_immunicity=True):
+def url_get(url, params={}, headers={}, with_immunicity=True, timeout=None):
+    import socket
     import urllib2
     from contextlib import closing
     from xbmctorrent import plugin
@@ -154,7 +182,7 @@ def url_get(url, params={}, headers={}, with_immunicity=True):
             req.set_proxy(proxy, parts[0])
 
     try:
-        with closing(urllib2.urlopen(req)) as response:
+        with closing(urllib2.urlopen(req, timeout=timeout or socket.getdefaulttimeout())) as response:
             data = response.read()
             if response.headers.get("Content-Encoding", "") == "gzip":
                 import zlib
@@ -0,0 +1,122 @@
+"""Lets xbmctorrent be imported outside of XBMC, on the mock XBMC modules of
+the bundled xbmcswift2. Import it before anything from xbmctorrent.
+
+xbmcswift2 runs from the root of an addon, so we make one up in a temporary
+directory, which also gets the profile (caches, settings...)."""
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+from xml.etree import cElementTree as ElementTree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Processes can share one with XBMCTORRENT_ADDON_DIR, the service benchmark does
+ADDON_DIR = os.environ.get("XBMCTORRENT_ADDON_DIR")
+if not ADDON_DIR:
+    ADDON_DIR = tempfile.mkdtemp(prefix="xbmctorrent-tests-")
+    atexit.register(shutil.rmtree, ADDON_DIR, True)
+
+sys.path.insert(0, os.path.join(ROOT, "resources", "site-packages"))
+
+if not os.path.exists(os.path.join(ADDON_DIR, "addon.xml")):
+    with open(os.path.join(ROOT, "addon.xml.tpl")) as fp:
+        addon_xml = fp.read().replace("$VERSION", "0.0.0")
+    with open(os.path.join(ADDON_DIR, "addon.xml"), "w") as fp:
+        fp.write(addon_xml)
+    shutil.copytree(os.path.join(ROOT, "resources", "language"), os.path.join(ADDON_DIR, "resources", "language"))
+    shutil.copy(os.path.join(ROOT, "resources", "settings.xml"), os.path.join(ADDON_DIR, "resources"))
+    open(os.path.join(ADDON_DIR, ".firstrun"), "w").close() # No first run dialog
+
+# The mock xbmcaddon reads settings from XBMCSWIFT2_<ID> environment variables
+os.environ.setdefault("XBMCSWIFT2_GA_DISABLE", "true") # Nothing to send to Google
+for node in ElementTree.parse(os.path.join(ROOT, "resources", "settings.xml")).getiterator("setting"):
+    if node.get("id") and node.get("default") is not None:
+        os.environ.setdefault("XBMCSWIFT2_%s" % node.get("id").upper(), node.get("default"))
+
+# xbmctorrent.common finds its resources next to the running script
+import __main__
+if not hasattr(__main__, "__file__"):
+    __main__.__file__ = os.path.join(ROOT, "addon.py")
+
+import logging
+logging.disable(logging.WARNING) # The mock getSetting warns on every call
+
+os.chdir(ADDON_DIR)
+tempfile.tempdir, _tempdir = ADDON_DIR, tempfile.tempdir # The mock profile goes in there
+try:
+    import xbmcswift2
+finally:
+    tempfile.tempdir = _tempdir
+for name in ("xbmc", "xbmcgui", "xbmcplugin", "xbmcaddon", "xbmcvfs"):
+    sys.modules[name] = getattr(xbmcswift2, name)
+
+class _Mock(object):
+    """Stands for the xbmcgui/xbmc classes the mock modules lack."""
+    def _ignore(self, *args, **kwargs):
+        pass
+    # Subclasses reach these through super(), which skips __getattr__
+    __init__ = create = update = close = _ignore
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+    def iscanceled(self):
+        return False
+
+xbmcswift2.xbmcgui.DialogProgress = _Mock
+xbmcswift2.xbmcgui.Window = _Mock
+xbmcswift2.xbmc.Player = _Mock
+
+_get_addon_info = xbmcswift2.xbmcaddon.Addon.getAddonInfo
+xbmcswift2.xbmcaddon.Addon.getAddonInfo = lambda self, id: id == "path" and ADDON_DIR or _get_addon_info(self, id)
+
+
+class FakeUDPTracker(object):
+    """Answers BEP 15 connect and scrape requests on a local port, after delay
+    seconds, and keeps the requests it got. Seeds and leechers are made from
+    the info-hashes."""
+
+    CONNECTION_ID = 0x1234567890
+
+    def __init__(self, error=None, wrong_transaction=False, delay=0):
+        import socket
+        import threading
+        self.requests = []
+        self.error = error
+        self.wrong_transaction = wrong_transaction
+        self.delay = delay
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.url = "udp://127.0.0.1:%d/announce" % self.port
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        import socket
+        import struct
+        import time
+        from xbmctorrent import trackers
+        while True:
+            try:
+                data, address = self.sock.recvfrom(4096)
+            except socket.error:
+                return
+            connection_id, action, transaction_id = struct.unpack(">QII", data[:16])
+            self.requests.append((connection_id, action, data[16:]))
+            time.sleep(self.delay)
+            if self.wrong_transaction:
+                self.sock.sendto(struct.pack(">II", action, transaction_id + 1) + "\0" * 8, address)
+            if action == trackers.UDP_ACTION_CONNECT:
+                self.sock.sendto(struct.pack(">IIQ", action, transaction_id, self.CONNECTION_ID), address)
+            elif self.error:
+                self.sock.sendto(struct.pack(">II", trackers.UDP_ACTION_ERROR, transaction_id) + self.error, address)
+            else:
+                digests = [data[i:i + 20] for i in range(16, len(data), 20)]
+                self.sock.sendto(struct.pack(">II", action, transaction_id) +
+                                 "".join(struct.pack(">III", ord(digest[0]), 100, ord(digest[1])) for digest in digests), address)
+
+    def close(self):
+        self.sock.close()
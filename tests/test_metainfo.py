@@ -0,0 +1,76 @@
+import hashlib
+import unittest
+import support
+from bencode import bencode, bdecode
+from xbmctorrent import monkey_patches
+from xbmctorrent import metainfo
+from xbmctorrent.metainfo import MetainfoError
+
+
+def make_torrent(pieces_length=20):
+    return {
+        "announce": "udp://tracker.example.com:80/announce",
+        "announce-list": [["udp://tracker.example.com:80/announce"], ["http://tracker.example.org/announce"]],
+        "creation date": 1400000000,
+        "info": {
+            "name": "Show Season 1",
+            "piece length": 16384,
+            "pieces": "\x01" * pieces_length,
+            "files": [
+                {"length": 1000, "path": ["Show.S01E01.mkv"]},
+                {"length": 2000, "path": ["Subs", "Show.S01E01.srt"]},
+            ],
+        },
+    }
+
+
+class DecodeTestCase(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(metainfo.decode("i42e")[0], 42)
+        self.assertEqual(metainfo.decode("i-3e")[0], -3)
+        self.assertEqual(metainfo.decode("4:spam")[0], "spam")
+        self.assertEqual(metainfo.decode("0:")[0], "")
+        self.assertEqual(metainfo.decode("le")[0], [])
+        self.assertEqual(metainfo.decode("de")[0], {})
+        self.assertEqual(metainfo.decode("l4:spami1eli2eed1:ai3eee")[0], ["spam", 1, [2], {"a": 3}])
+        self.assertEqual(metainfo.decode("d1:ad1:bl1:cee1:di4ee")[0], {"a": {"b": ["c"]}, "d": 4})
+
+    def test_same_as_bdecode(self):
+        data = bencode(make_torrent())
+        self.assertEqual(metainfo.decode(data)[0], bdecode(data))
+
+    def test_long_strings_are_buffers(self):
+        data = bencode(make_torrent(metainfo.BUFFER_MIN_LENGTH))
+        pieces = metainfo.decode(data)[0]["info"]["pieces"]
+        self.assertIsInstance(pieces, buffer)
+        self.assertEqual(str(pieces), "\x01" * metainfo.BUFFER_MIN_LENGTH)
+
+    def test_info_span(self):
+        torrent = make_torrent()
+        data = bencode(torrent)
+        start, end = metainfo.decode(data)[1]
+        self.assertEqual(data[start:end], bencode(torrent["info"]))
+
+    def test_no_info_span(self):
+        self.assertIsNone(metainfo.decode("d4:infoi1ee")[1])
+        self.assertIsNone(metainfo.decode("d1:ad4:infod1:ai1eeee")[1]) # Not top level
+
+    def test_invalid(self):
+        for data in ("", "i42", "4:spa", "l4:spam", "d4:spame", "di1ei2ee", "-1:a", "i1ei2e", "e", "x", "ix:e"):
+            self.assertRaises(MetainfoError, metainfo.decode, data)
+
+
+class ParseTestCase(unittest.TestCase):
+    def test_info_hash(self):
+        torrent = make_torrent(metainfo.BUFFER_MIN_LENGTH * 2)
+        metadata, digest = metainfo.parse(bencode(torrent))
+        self.assertEqual(digest, hashlib.sha1(bencode(torrent["info"])).hexdigest())
+        self.assertEqual(metadata["info"]["name"], "Show Season 1")
+
+    def test_no_info(self):
+        self.assertRaises(MetainfoError, metainfo.parse, "d8:announce3:urle")
+        self.assertRaises(MetainfoError, metainfo.parse, "l4:infoe")
+
+
+if __name__ == "__main__":
+    unittest.main()
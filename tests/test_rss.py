@@ -0,0 +1,78 @@
+import random
+import time
+import unittest
+import support
+from xbmctorrent import monkey_patches, plugin, magnet, tmdb
+from xbmctorrent.caching import join_prefetches
+from xbmctorrent.scrapers import rss
+
+
+def make_items(count):
+    return [{
+        "title": "Movie.%d.2014.720p" % i,
+        "href": "magnet:?xt=urn:btih:%040x" % i,
+        "category": "Movies",
+        "seeds": i,
+        "peers": i,
+        "imdb_id": i % 3 and "tt%07d" % i or None,
+    } for i in range(count)]
+
+
+class RenderTestCase(unittest.TestCase):
+    def setUp(self):
+        self._get, self._get_list_item = tmdb.get, tmdb.get_list_item
+        tmdb.get = self.fake_get
+        tmdb.get_list_item = lambda data: {"label": data["imdb_id"], "info": {}}
+
+    def tearDown(self):
+        tmdb.get, tmdb.get_list_item = self._get, self._get_list_item
+
+    def fake_get(self, imdb_id):
+        time.sleep(random.random() / 50) # So that lookups complete out of order
+        return {"imdb_id": imdb_id}
+
+    def test_keeps_feed_order(self):
+        items = make_items(20)
+        list_items = list(rss.render(items, content_type="movies"))
+        self.assertEqual([list_item["path"] for list_item in list_items],
+                         [rss.make_list_item(item)["path"] for item in items])
+
+    def test_uses_tmdb_metadata(self):
+        items = make_items(6)
+        for item, list_item in zip(items, rss.render(items, content_type="movies")):
+            self.assertTrue(list_item["label"].startswith(item["imdb_id"] or item["title"]))
+
+
+class ConvertEnclosuresTestCase(unittest.TestCase):
+    def setUp(self):
+        self.converted = []
+        self._from_torrent_urls, self._setting = magnet.from_torrent_urls, plugin.get_setting("convert_torrents")
+        magnet.from_torrent_urls = self.fake_from_torrent_urls
+
+    def tearDown(self):
+        magnet.from_torrent_urls = self._from_torrent_urls
+        plugin.set_setting("convert_torrents", self._setting)
+
+    def fake_from_torrent_urls(self, urls):
+        time.sleep(0.1)
+        self.converted.extend(urls)
+
+    def make_items(self):
+        return [{"href": "http://example.com/%d.torrent" % i} for i in range(3)] + [{"href": "magnet:?xt=urn:btih:%040x" % 0}]
+
+    def test_converts_in_background(self):
+        plugin.set_setting("convert_torrents", "true")
+        items = rss.convert_enclosures(self.make_items())
+        self.assertEqual([item["href"] for item in items], [item["href"] for item in self.make_items()])
+        join_prefetches()
+        self.assertEqual(self.converted, [item["href"] for item in self.make_items()[:3]])
+
+    def test_disabled(self):
+        plugin.set_setting("convert_torrents", "false")
+        rss.convert_enclosures(self.make_items())
+        join_prefetches()
+        self.assertEqual(self.converted, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import socket
+import time
+import unittest
+import support
+from support import FakeUDPTracker
+from xbmctorrent import monkey_patches
+from xbmctorrent import trackers, utils
+from xbmctorrent.caching import shelf
+
+
+def make_digests(count):
+    return ["%02x%02x%s" % (i % 256, (i * 7) % 256, "ab" * 18) for i in range(count)]
+
+
+class ScrapeUDPTestCase(unittest.TestCase):
+    def scrape(self, tracker, digests):
+        self.addCleanup(tracker.close)
+        return trackers.scrape_udp("127.0.0.1", tracker.port, digests, timeout=2)
+
+    def test_connect_request(self):
+        tracker = FakeUDPTracker()
+        self.scrape(tracker, make_digests(1))
+        connection_id, action, payload = tracker.requests[0]
+        self.assertEqual(connection_id, trackers.UDP_PROTOCOL_ID)
+        self.assertEqual(action, trackers.UDP_ACTION_CONNECT)
+        self.assertEqual(payload, "")
+
+    def test_scrape_requests_are_chunked(self):
+        tracker = FakeUDPTracker()
+        digests = make_digests(trackers.UDP_MAX_SCRAPE + 26)
+        self.scrape(tracker, digests)
+        scrapes = tracker.requests[1:]
+        self.assertEqual(len(scrapes), 2)
+        for connection_id, action, payload in scrapes:
+            self.assertEqual(connection_id, FakeUDPTracker.CONNECTION_ID)
+            self.assertEqual(action, trackers.UDP_ACTION_SCRAPE)
+        self.assertEqual(scrapes[0][2], "".join(digest.decode("hex") for digest in digests[:trackers.UDP_MAX_SCRAPE]))
+        self.assertEqual(scrapes[1][2], "".join(digest.decode("hex") for digest in digests[trackers.UDP_MAX_SCRAPE:]))
+
+    def test_swarms(self):
+        digests = make_digests(trackers.UDP_MAX_SCRAPE + 26)
+        swarms = self.scrape(FakeUDPTracker(), digests)
+        self.assertEqual(sorted(swarms), sorted(digests))
+        for i, digest in enumerate(digests):
+            self.assertEqual(swarms[digest], (i % 256, (i * 7) % 256)) # seeds, leechers
+
+    def test_ignores_other_transactions(self):
+        digests = make_digests(3)
+        swarms = self.scrape(FakeUDPTracker(wrong_transaction=True), digests)
+        self.assertEqual(sorted(swarms), sorted(digests))
+
+    def test_error(self):
+        with self.assertRaises(socket.error) as cm:
+            self.scrape(FakeUDPTracker(error="Torrent not found"), make_digests(3))
+        self.assertIn("Torrent not found", str(cm.exception))
+
+    def test_timeout(self):
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(("127.0.0.1", 0))
+        self.addCleanup(silent.close)
+        with self.assertRaises(socket.timeout):
+            trackers.scrape_udp("127.0.0.1", silent.getsockname()[1], make_digests(1), timeout=0.2)
+
+
+class ProbeUDPTestCase(unittest.TestCase):
+    def test_latency(self):
+        tracker = FakeUDPTracker(delay=0.1)
+        self.addCleanup(tracker.close)
+        latency = trackers.probe_udp("127.0.0.1", tracker.port, timeout=2)
+        self.assertGreaterEqual(latency, 0.1)
+        self.assertLess(latency, 2)
+        self.assertEqual(tracker.requests, [(trackers.UDP_PROTOCOL_ID, trackers.UDP_ACTION_CONNECT, "")])
+
+    def test_timeout(self):
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(("127.0.0.1", 0))
+        self.addCleanup(silent.close)
+        with self.assertRaises(socket.timeout):
+            trackers.probe_udp("127.0.0.1", silent.getsockname()[1], timeout=0.2)
+
+
+class BestTrackersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fast = FakeUDPTracker()
+        self.slow = FakeUDPTracker(delay=0.2)
+        self.addCleanup(self.fast.close)
+        self.addCleanup(self.slow.close)
+        self.dead = "udp://127.0.0.1:1/announce"
+        self.unknown = "udp://127.0.0.1:2/announce"
+        self.candidates = [self.dead, self.slow.url, self.unknown, self.fast.url]
+        with shelf("xbmctorrent.trackers") as health:
+            health.clear()
+            health[self.dead] = {"latency": None, "checked_at": time.time()}
+
+        self.probed = []
+        self._get_candidates, self._run_in_background = trackers.get_candidates, utils.run_in_background
+        trackers.get_candidates = lambda: self.candidates
+        utils.run_in_background = lambda lock, fn, items: self.probed.extend(items)
+
+    def tearDown(self):
+        trackers.get_candidates, utils.run_in_background = self._get_candidates, self._run_in_background
+
+    def test_ranking(self):
+        trackers.probe_all([self.slow.url, self.fast.url])
+        self.assertEqual(trackers.get_best_trackers(), [self.fast.url, self.slow.url, self.unknown])
+        self.assertEqual(self.probed, [self.unknown])
+
+    def test_count(self):
+        trackers.probe_all([self.slow.url, self.fast.url])
+        self.assertEqual(trackers.get_best_trackers(count=1), [self.fast.url])
+
+    def test_stale_results_are_probed_again(self):
+        with shelf("xbmctorrent.trackers") as health:
+            health[self.fast.url] = {"latency": 0.01, "checked_at": time.time() - trackers.PROBE_TTL - 1}
+        trackers.get_best_trackers()
+        self.assertEqual(sorted(self.probed), sorted([self.slow.url, self.unknown, self.fast.url]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import threading
+import unittest
+import support
+from xbmctorrent import monkey_patches
+from xbmctorrent.utils import get_season_pack_from_name, run_in_background
+
+
+class SeasonPackTestCase(unittest.TestCase):
+    def test_season_packs(self):
+        self.assertEqual(get_season_pack_from_name("Show.S01.720p.HDTV.x264-GRP"), 1)
+        self.assertEqual(get_season_pack_from_name("show.s05.complete"), 5)
+        self.assertEqual(get_season_pack_from_name("Show S03 [Complete]"), 3)
+        self.assertEqual(get_season_pack_from_name("Show Season 2 Complete"), 2)
+        self.assertEqual(get_season_pack_from_name("Show.Season.4.720p"), 4)
+
+    def test_single_episodes(self):
+        self.assertIsNone(get_season_pack_from_name("Show.S01E02.720p.HDTV.x264-GRP"))
+        self.assertIsNone(get_season_pack_from_name("Show 1x02 HDTV"))
+
+    def test_not_series(self):
+        self.assertIsNone(get_season_pack_from_name("Movie.2014.1080p.BluRay"))
+        self.assertIsNone(get_season_pack_from_name("Things.SS12"))
+
+
+class RunInBackgroundTestCase(unittest.TestCase):
+    def test_runs_one_at_a_time(self):
+        lock, started, finish = threading.Lock(), threading.Event(), threading.Event()
+        runs = []
+        def _run(name):
+            runs.append(name)
+            started.set()
+            finish.wait(2)
+        run_in_background(lock, _run, "first")
+        started.wait(2)
+        run_in_background(lock, _run, "second") # Still running, skipped
+        finish.set()
+        with lock: # Released once the first run is over
+            pass
+        self.assertEqual(runs, ["first"])
+
+
+if __name__ == "__main__":
+    unittest.main()